@@ -0,0 +1,151 @@
+import argparse
+import datetime
+import gc
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import warnings
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARK_DIR))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'takkobebe.settings')
+
+import django
+django.setup()
+
+from takko.pipeline import TakkoOrder
+from takko.pipeline import TakkoInvoice
+from synthetic import make_order_sheet
+from synthetic import make_invoice_sheet
+
+
+# 단계별 실행 시간과 최대 메모리(tracemalloc 기준)를 재고 results.jsonl에 쌓아서 이전 실행과 비교한다.
+# 시간은 REPEAT번 중 가장 빠른 값을 쓴다.
+DEFAULT_SIZES = [1000, 10000, 100000]
+REPEAT = 3
+REGRESSION_THRESHOLD = 1.2
+CHUNK_SIZE = 10000
+
+warnings.simplefilter('ignore', FutureWarning)
+
+
+def measure(func, *args, setup=None):
+    # setup을 주면 매번 setup()이 돌려준 인자로 func를 부른다. setup 시간과 메모리는 재지 않는다.
+    seconds = None
+    for _ in range(REPEAT):
+        call_args = setup() if setup is not None else args
+        gc.collect()
+        start = time.perf_counter()
+        result = func(*call_args)
+        elapsed = time.perf_counter() - start
+        seconds = elapsed if seconds is None else min(seconds, elapsed)
+
+    call_args = setup() if setup is not None else args
+    gc.collect()
+    tracemalloc.start()
+    func(*call_args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, seconds, peak
+
+
+def bench_order(path):
+    # 객체는 한 번만 생성자로 만들고 단계별 메서드를 따로 잰다. 내부 속성을 직접 채우지 않는다.
+    # 수취인 객체는 처음 계산한 값을 기억하므로 합치기는 매번 새로 묶은 수취인으로 잰다.
+    stages = []
+
+    order_df, seconds, peak = measure(TakkoOrder._read_sheet_file, path)
+    stages.append(('_read_sheet_file', seconds, peak))
+    order = TakkoOrder(order_df)
+    _, seconds, peak = measure(order._get_unique_recipients)
+    stages.append(('_get_unique_recipients', seconds, peak))
+    _, seconds, peak = measure(order.combine_all_orders, setup=lambda: (order._get_unique_recipients(),))
+    stages.append(('combine_all_orders', seconds, peak))
+    _, seconds, peak = measure(lambda: order.save_to_excel(io.BytesIO()))
+    stages.append(('save_to_excel', seconds, peak))
+
+    _, seconds, peak = measure(lambda: TakkoOrder(order_df, streaming=True).save_to_excel(io.BytesIO()))
+    stages.append(('save_to_excel (streaming, with grouping)', seconds, peak))
+    _, seconds, peak = measure(lambda: TakkoOrder(path, streaming=True, chunk_size=CHUNK_SIZE)
+                               .save_to_excel(io.BytesIO()))
+    stages.append(('save_to_excel (chunked, with grouping)', seconds, peak))
+    return stages
+
+
+def bench_invoice(path):
+    stages = []
+
+    invoice_df, seconds, peak = measure(TakkoInvoice._read_sheet_file, path)
+    stages.append(('TakkoInvoice._read_sheet_file', seconds, peak))
+    invoice = TakkoInvoice(invoice_df)
+    _, seconds, peak = measure(invoice._convert_invoice_form)
+    stages.append(('TakkoInvoice._convert_invoice_form', seconds, peak))
+    _, seconds, peak = measure(lambda: invoice.save_to_excel(io.BytesIO()))
+    stages.append(('TakkoInvoice.save_to_excel', seconds, peak))
+    return stages
+
+
+def load_previous_results(results_file):
+    previous = {}
+    if os.path.exists(results_file):
+        with open(results_file) as f:
+            for line in f:
+                result = json.loads(line)
+                previous[(result['stage'], result['rows'])] = result
+    return previous
+
+
+def get_git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=BENCHMARK_DIR,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    global REPEAT
+    parser = argparse.ArgumentParser(description='takko 주문/송장 파이프라인 벤치마크')
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES)
+    parser.add_argument('--repeat', type=int, default=REPEAT)
+    parser.add_argument('--results', default=os.path.join(BENCHMARK_DIR, 'results.jsonl'))
+    parser.add_argument('--no-record', action='store_true', help='결과를 results 파일에 기록하지 않는다')
+    args = parser.parse_args()
+    REPEAT = args.repeat
+
+    previous = load_previous_results(args.results)
+    run = {'date': datetime.datetime.now().isoformat(timespec='seconds'), 'revision': get_git_revision()}
+    results = []
+    with tempfile.TemporaryDirectory(prefix='takko-bench-') as workspace:
+        for rows in args.sizes:
+            order_path = os.path.join(workspace, 'orders_%d.xlsx' % rows)
+            invoice_path = os.path.join(workspace, 'invoice_%d.xlsx' % rows)
+            make_order_sheet(rows).to_excel(order_path, index=False)
+            make_invoice_sheet(max(1, rows // 3)).to_excel(invoice_path, index=False)
+
+            for stage, seconds, peak in bench_order(order_path) + bench_invoice(invoice_path):
+                result = dict(run, stage=stage, rows=rows, seconds=round(seconds, 4), peak_bytes=peak)
+                results.append(result)
+
+                note = ''
+                last = previous.get((stage, rows))
+                if last is not None and last['seconds'] > 0:
+                    ratio = seconds / last['seconds']
+                    note = 'x%.2f vs %s' % (ratio, last['revision'])
+                    if ratio > REGRESSION_THRESHOLD:
+                        note += '  REGRESSION'
+                print('%7d  %-42s %9.3f s %10.1f MB  %s' % (rows, stage, seconds, peak / 2 ** 20, note))
+
+    if not args.no_record:
+        with open(args.results, 'a') as f:
+            for result in results:
+                f.write(json.dumps(result, ensure_ascii=False) + '\n')
+
+
+if __name__ == '__main__':
+    main()
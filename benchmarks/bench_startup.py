@@ -0,0 +1,50 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_DIR = os.path.dirname(BENCHMARK_DIR)
+
+
+# 새 프로세스에서 takkobebe.wsgi.application을 불러오는 시간(워커 콜드 스타트)을 잰다.
+# 엑셀 처리 모듈은 첫 요청 때 불러오므로 그 시간도 따로 잰다. 시간은 REPEAT번의 최솟값과 중앙값을 쓴다.
+REPEAT = 10
+HEAVY_MODULES = ['numpy', 'pandas', 'xlsxwriter', 'openpyxl', 'xlrd', 'takko.pipeline']
+
+_probe = '''
+import json, sys, time
+start = time.perf_counter()
+from takkobebe.wsgi import application
+from django.urls import resolve
+resolve('/takko/takko')
+startup = time.perf_counter() - start
+loaded = [name for name in %r if name in sys.modules]
+start = time.perf_counter()
+import takko.pipeline, takko.store
+print(json.dumps({'startup': startup, 'pipeline': time.perf_counter() - start, 'loaded': loaded}))
+''' % (HEAVY_MODULES,)
+
+
+def run_probe():
+    env = dict(os.environ, DJANGO_SETTINGS_MODULE='takkobebe.settings')
+    output = subprocess.check_output([sys.executable, '-c', _probe], cwd=PROJECT_DIR, env=env)
+    return json.loads(output.decode().strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='takkobebe.wsgi.application 시작 시간 벤치마크')
+    parser.add_argument('--repeat', type=int, default=REPEAT)
+    args = parser.parse_args()
+
+    probes = [run_probe() for _ in range(args.repeat)]
+    for stage, description in [('startup', 'wsgi application 불러오기'), ('pipeline', '첫 요청 때 pipeline 불러오기')]:
+        seconds = [probe[stage] for probe in probes]
+        print('%-32s min %7.3f s  median %7.3f s' % (description, min(seconds), statistics.median(seconds)))
+    print('시작할 때 불러온 무거운 모듈: %s' % (', '.join(probes[0]['loaded']) or '없음'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+import os
+import random
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'takkobebe.settings')
+
+import django
+django.setup()
+
+from takko.pipeline import visual_len
+
+
+def regex_visual_len(string):
+    string_length = len(string)
+    charnumeric_length = len(re.findall(r'\w', string))
+    alphanumeric_length = len(re.findall('[A-Za-z0-9]', string))
+    korean_length = charnumeric_length - alphanumeric_length
+    return string_length + korean_length * 0.75 + 1
+
+
+def sample_cells(n, seed=0):
+    r = random.Random(seed)
+    words = ['아기 이불', '유아 내복 세트', 'Baby Bottle 250ml', '턱받이', '색상: 핑크', '사이즈: 90', 'nan',
+             '서울특별시 강남구 테헤란로 123', '010-1234-5678', '2018052412345678', '문 앞에 놔주세요_',
+             'ｆｕｌｌｗｉｄｔｈ', '①②③', 'Ünïcödé', '中文字符']
+    cells = []
+    for _ in range(n):
+        cells.append(' --- '.join(r.choice(words) for _ in range(r.randint(1, 4))))
+    return cells
+
+
+def fuzz_strings(n, seed=0):
+    r = random.Random(seed)
+    return [''.join(chr(r.randrange(0x20, 0x3000)) for _ in range(r.randint(0, 20))) for _ in range(n)]
+
+
+def main():
+    cells = sample_cells(20000)
+    for string in cells + fuzz_strings(20000):
+        assert visual_len(string) == regex_visual_len(string), string
+
+    number = 5
+    regex_time = timeit.timeit(lambda: [regex_visual_len(cell) for cell in cells], number=number)
+    visual_len.cache_clear()
+    cold_time = timeit.timeit(lambda: (visual_len.cache_clear(), [visual_len(cell) for cell in cells]), number=number)
+    warm_time = timeit.timeit(lambda: [visual_len(cell) for cell in cells], number=number)
+
+    print('cells: %d, runs: %d' % (len(cells), number))
+    print('regex          %8.2f ms' % (regex_time / number * 1000))
+    print('visual_len     %8.2f ms  (cold cache, x%.1f)' % (cold_time / number * 1000, regex_time / cold_time))
+    print('visual_len     %8.2f ms  (warm cache, x%.1f)' % (warm_time / number * 1000, regex_time / warm_time))
+
+
+if __name__ == '__main__':
+    main()
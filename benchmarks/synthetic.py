@@ -0,0 +1,92 @@
+import json
+import random
+
+import numpy as np
+import pandas as pd
+
+
+# 스마트스토어 주문 내역과 택배사 송장 시트를 흉내 낸 가짜 데이터를 만든다.
+_surnames = '김이박최정강조윤장임한오서신권황안송류홍'
+_given_name_syllables = '민서지하준도윤예은수현우진영주아연성희태'
+_cities = [('서울특별시', ['강남구', '마포구', '송파구', '관악구', '노원구']),
+           ('부산광역시', ['해운대구', '수영구', '동래구']),
+           ('경기도', ['성남시 분당구', '수원시 영통구', '고양시 일산동구', '용인시 수지구']),
+           ('대구광역시', ['수성구', '달서구']),
+           ('제주특별자치도', ['제주시', '서귀포시'])]
+_roads = ['테헤란로', '월드컵북로', '올림픽로', '해운대해변로', '판교역로', '중앙대로', '연북로']
+_goods = [('아기 이불', ['색상: 핑크', '색상: 블루', '색상: 아이보리']),
+          ('유아 내복 세트', ['사이즈: 80 / 색상: 그레이', '사이즈: 90 / 색상: 그레이', '사이즈: 100 / 색상: 민트']),
+          ('턱받이 3종', [None]),
+          ('Baby Bottle 250ml', ['젖꼭지: S', '젖꼭지: M']),
+          ('신생아 속싸개', [None, '무늬: 곰돌이']),
+          ('아기 양말 5켤레', ['사이즈: S', '사이즈: M', '사이즈: L'])]
+_comments = ['부재시 문 앞에 놓아주세요', '경비실에 맡겨주세요', '배송 전 연락 부탁드립니다', '']
+
+
+def _make_recipient(r, i):
+    city, districts = r.choice(_cities)
+    address = '%s %s %s %d, %d동 %d호' % (city, r.choice(districts), r.choice(_roads), r.randint(1, 999),
+                                        r.randint(101, 120), r.randint(101, 1504))
+    name = r.choice(_surnames) + ''.join(r.choice(_given_name_syllables) for _ in range(2))
+    phone_number = '010-%04d-%04d' % (r.randrange(10000), i % 10000)
+    return name, phone_number, address, '%05d' % r.randint(1000, 63644), '%03d-%03d' % (r.randint(100, 799),
+                                                                                      r.randint(0, 999))
+
+
+def make_order_sheet(rows, repeat_ratio=0.3, seed=0):
+    r = random.Random(seed)
+    recipients = []
+    good_order_id = 2018050100000000
+    order_id = 2018050100000
+    records = []
+    while len(records) < rows:
+        if recipients and r.random() < repeat_ratio:
+            recipient = r.choice(recipients)
+        else:
+            recipient = _make_recipient(r, len(recipients))
+            recipients.append(recipient)
+        name, phone_number, address, zip_code, old_zip_code = recipient
+
+        order_id += r.randint(1, 7)
+        comment = r.choice(_comments) if r.random() < 0.3 else np.nan
+        for _ in range(min(r.choice([1, 1, 1, 2, 2, 3, 5]), rows - len(records))):
+            good_order_id += r.randint(1, 7)
+            good_name, options = r.choice(_goods)
+            option = r.choice(options)
+            records.append({'상품주문번호': good_order_id,
+                            '주문 번호': order_id,
+                            '수취인 이름': name,
+                            '수취인 핸드폰 번호': phone_number,
+                            '수취인 전체주소': address,
+                            '수취인 우편번호': zip_code,
+                            '수취인 구 우편번호 (6자리)': old_zip_code,
+                            '상품명': good_name,
+                            '옵션정보': np.nan if option is None else option,
+                            '상품수량': r.choice([1, 1, 1, 2, 3]),
+                            '주문시 남기는 글': comment})
+    return pd.DataFrame(records)
+
+
+def make_invoice_sheet(rows, seed=0):
+    r = random.Random(seed)
+    good_order_id = 2018050100000000
+    order_id = 2018050100000
+    records = []
+    for i in range(rows):
+        combined_order_ids = {}
+        for _ in range(r.choice([1, 1, 1, 2, 3])):
+            order_id += r.randint(1, 7)
+            good_order_ids = []
+            for _ in range(r.choice([1, 1, 2, 3])):
+                good_order_id += r.randint(1, 7)
+                good_order_ids.append(good_order_id)
+            combined_order_ids[order_id] = good_order_ids
+
+        name, phone_number, address, zip_code, _ = _make_recipient(r, i)
+        records.append({'운송장번호': 600000000000 + i * 7,
+                        '받는분': name,
+                        '받는분 전화번호': phone_number,
+                        '받는분 주소': address,
+                        '우편번호': zip_code,
+                        '상품주문번호 리스트': json.dumps(combined_order_ids)})
+    return pd.DataFrame(records)
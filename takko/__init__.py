@@ -0,0 +1,2 @@
+# 결과 캐시 키에 들어가므로 결과 파일의 내용(형식, 열)이 바뀌면 올린다.
+__version__ = '0.1.3'
@@ -0,0 +1,145 @@
+import json
+
+from django.http import JsonResponse
+from django.http import StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+
+from . import instrumentation
+
+
+# 스크립트에서 엑셀 없이 쓰는 JSON API. 시트의 한 행을 {열 이름: 값} 객체 하나로 받고, 결과도 한 행씩 NDJSON으로 흘려보낸다.
+# 요청 본문은 객체 배열(application/json)이나 한 줄에 객체 하나(application/x-ndjson)다.
+# pipeline은 pandas를 불러오므로 views처럼 요청이 왔을 때 불러온다.
+_ndjson_content_types = ['application/x-ndjson', 'application/ndjson', 'application/jsonl']
+
+_required_order_columns = ['수취인 이름', '수취인 핸드폰 번호', '수취인 전체주소', '주문 번호', '상품주문번호', '상품명']
+
+
+class _BadRequest(Exception):
+    pass
+
+
+def _read_rows(request):
+    # NDJSON은 본문을 한꺼번에 읽지 않고 한 줄씩 읽는다.
+    try:
+        if request.content_type in _ndjson_content_types:
+            rows = [json.loads(line) for line in request if line.strip()]
+        else:
+            rows = json.load(request)
+    except ValueError as e:
+        raise _BadRequest('JSON을 읽을 수 없습니다: %s' % e)
+    if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+        raise _BadRequest('행마다 {열 이름: 값} 객체 하나여야 합니다.')
+    return rows
+
+
+def _to_order_ids_string(row_number, order_ids):
+    # TakkoInvoice가 읽을 수 있는 {주문 번호: [상품주문번호, ...]} 객체나 그 JSON 문자열인지 미리 확인하고 문자열로 돌려준다.
+    order_ids_object = order_ids
+    if isinstance(order_ids, str):
+        try:
+            order_ids_object = json.loads(order_ids)
+        except ValueError:
+            order_ids_object = None
+    if not isinstance(order_ids_object, dict) or not all(
+            isinstance(good_order_ids, list)
+            and all(isinstance(good_order_id, int) and not isinstance(good_order_id, bool)
+                    for good_order_id in good_order_ids)
+            for good_order_ids in order_ids_object.values()):
+        raise _BadRequest('%d번째 행의 상품주문번호 리스트는 {"주문 번호": [상품주문번호, ...]} 객체여야 합니다.' % row_number)
+    return order_ids if isinstance(order_ids, str) else json.dumps(order_ids)
+
+
+def _to_json_value(value):
+    import numpy as np
+    import pandas as pd
+
+    if isinstance(value, np.ndarray):
+        return [_to_json_value(item) for item in value.tolist()]
+    if value is None or pd.isna(value):
+        return None
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def _stream_rows(label, columns, rows):
+    def stream():
+        with instrumentation.collect(label):
+            with instrumentation.stage('write') as record:
+                record.rows = 0
+                for row in rows:
+                    record.rows += 1
+                    yield json.dumps(dict(zip(columns, row)), ensure_ascii=False) + '\n'
+
+    return StreamingHttpResponse(stream(), content_type='application/x-ndjson')
+
+
+def _bad_request(message):
+    return JsonResponse({'error': message}, status=400)
+
+
+@csrf_exempt
+@require_POST
+def combine_orders(request):
+    # 주문 행을 받아서 수취인별로 합친 행을 돌려준다. '상품주문번호 리스트'는 문자열이 아니라 객체로 준다.
+    import pandas as pd
+    from .pipeline import TakkoOrder
+    from .pipeline import to_order_sheet
+
+    try:
+        rows = _read_rows(request)
+    except _BadRequest as e:
+        return _bad_request(str(e))
+    # 값은 JSON으로 받은 그대로 두고 to_order_sheet에서 맞춘다. 빈 값이 섞인 정수 열이 실수로 바뀌지 않게 한다.
+    orders_df = pd.DataFrame(rows, dtype=object)
+    missing = [column for column in _required_order_columns if column not in orders_df] if rows else []
+    if missing:
+        return _bad_request('필요한 열이 없습니다: %s' % ', '.join(missing))
+    # 응답을 흘려보내기 시작한 뒤에는 400을 줄 수 없으므로 값은 여기서 모두 확인한다.
+    try:
+        orders_df = to_order_sheet(orders_df)
+    except ValueError as e:
+        return _bad_request(str(e))
+
+    takko_order = TakkoOrder(orders_df, streaming=True)
+    columns = takko_order.out_columns
+    order_ids_index = columns.index('상품주문번호 리스트')
+
+    def combined_orders():
+        for row in takko_order.iter_combined_orders():
+            row = [_to_json_value(value) for value in row]
+            row[order_ids_index] = json.loads(row[order_ids_index])
+            yield row
+
+    return _stream_rows('order', columns, combined_orders())
+
+
+@csrf_exempt
+@require_POST
+def convert_invoices(request):
+    # 운송장번호와 '상품주문번호 리스트'가 있는 행을 받아서 상품마다 송장 일괄등록 행을 돌려준다.
+    # '상품주문번호 리스트'는 주문 API가 돌려준 객체 그대로 보내도 되고 시트처럼 JSON 문자열로 보내도 된다.
+    import pandas as pd
+    from .pipeline import TakkoInvoice
+
+    # to_order_sheet처럼 TakkoInvoice에 넘기기 전에 상품주문번호 리스트를 모두 확인한다.
+    try:
+        rows = _read_rows(request)
+        for row_number, row in enumerate(rows, start=1):
+            row['상품주문번호 리스트'] = _to_order_ids_string(row_number, row.get('상품주문번호 리스트'))
+    except _BadRequest as e:
+        return _bad_request(str(e))
+    if not rows:
+        return _stream_rows('invoice', [], [])
+    try:
+        # 남은 오류는 송장 번호 열을 찾지 못했을 때 TakkoInvoice가 던지는 Exception뿐이다.
+        takko_invoice = TakkoInvoice(pd.DataFrame.from_records(rows))
+    except Exception as e:
+        return _bad_request(str(e))
+
+    converted_invoice_df = takko_invoice.converted_invoice_df
+    return _stream_rows('invoice', list(converted_invoice_df.columns),
+                        ([_to_json_value(value) for value in row]
+                         for row in converted_invoice_df.itertuples(index=False)))
@@ -0,0 +1,127 @@
+import contextlib
+import json
+import logging
+import threading
+import time
+import tracemalloc
+
+from django.conf import settings
+
+
+# 주문/송장 처리 단계별 시간, 행 수, 최대 메모리를 모은다.
+# TAKKO_INSTRUMENTATION이 꺼져 있으면 stage()는 아무것도 하지 않는 컨텍스트를 돌려준다.
+# TAKKO_INSTRUMENTATION_MEMORY를 켜면 tracemalloc으로 단계별 최대 메모리를 재는데, 프로세스 전체를 추적하므로
+# 동시에 처리 중인 다른 요청의 할당도 함께 잡힌다.
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+_memory_lock = threading.Lock()
+_memory_users = 0
+
+
+class StageRecord(object):
+    __slots__ = ('name', 'seconds', 'rows', 'peak_bytes')
+
+    def __init__(self, name):
+        self.name = name
+        self.seconds = None
+        self.rows = None
+        self.peak_bytes = None
+
+    def as_dict(self):
+        record = {'stage': self.name, 'seconds': round(self.seconds, 6)}
+        if self.rows is not None:
+            record['rows'] = int(self.rows)
+        if self.peak_bytes is not None:
+            record['peak_bytes'] = self.peak_bytes
+        return record
+
+
+_null_stage = contextlib.nullcontext(StageRecord(None))
+
+
+def is_enabled():
+    return getattr(settings, 'TAKKO_INSTRUMENTATION', True)
+
+
+def _is_memory_enabled():
+    return getattr(settings, 'TAKKO_INSTRUMENTATION_MEMORY', False)
+
+
+def _start_memory_trace():
+    global _memory_users
+    with _memory_lock:
+        if _memory_users == 0:
+            tracemalloc.start()
+        else:
+            tracemalloc.reset_peak()
+        _memory_users += 1
+
+
+def _stop_memory_trace():
+    global _memory_users
+    with _memory_lock:
+        _, peak = tracemalloc.get_traced_memory()
+        _memory_users -= 1
+        if _memory_users == 0:
+            tracemalloc.stop()
+    return peak
+
+
+def stage(name):
+    records = getattr(_local, 'records', None)
+    if records is None:
+        return _null_stage
+    return _measure_stage(name, records)
+
+
+@contextlib.contextmanager
+def _measure_stage(name, records):
+    record = StageRecord(name)
+    trace_memory = _is_memory_enabled()
+    if trace_memory:
+        _start_memory_trace()
+    start = time.perf_counter()
+    try:
+        yield record
+    finally:
+        record.seconds = time.perf_counter() - start
+        if trace_memory:
+            record.peak_bytes = _stop_memory_trace()
+        records.append(record)
+        logger.debug(json.dumps(dict(record.as_dict(), event='takko.stage'), ensure_ascii=False))
+
+
+@contextlib.contextmanager
+def collect(label):
+    # 이 블록 안에서 stage()로 잰 기록을 모은다. 꺼져 있으면 빈 목록만 돌려준다.
+    if not is_enabled():
+        yield []
+        return
+
+    records = []
+    previous_records = getattr(_local, 'records', None)
+    _local.records = records
+    start = time.perf_counter()
+    try:
+        yield records
+    finally:
+        _local.records = previous_records
+        logger.info(json.dumps({'event': 'takko.pipeline', 'label': label,
+                                'seconds': round(time.perf_counter() - start, 6),
+                                'stages': [record.as_dict() for record in records]}, ensure_ascii=False))
+
+
+def server_timing(records):
+    metrics = []
+    for record in records:
+        metric = '%s;dur=%.1f' % (record.name, record.seconds * 1000)
+        desc = []
+        if record.rows is not None:
+            desc.append('rows=%d' % record.rows)
+        if record.peak_bytes is not None:
+            desc.append('peak=%.1fMB' % (record.peak_bytes / 2 ** 20))
+        if desc:
+            metric += ';desc="%s"' % ' '.join(desc)
+        metrics.append(metric)
+    return ', '.join(metrics)
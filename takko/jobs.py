@@ -0,0 +1,187 @@
+import json
+import os
+import shutil
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+
+from . import instrumentation
+from . import result_cache
+
+
+# 작업 상태는 작업 폴더 안의 파일로만 관리한다. 그래야 어느 워커 프로세스에서든 상태 조회와 다운로드가 가능하다.
+def _get_job_root():
+    return getattr(settings, 'TAKKO_JOB_DIR', os.path.join(settings.BASE_DIR, 'takko_jobs'))
+
+
+def _get_job_workers():
+    return getattr(settings, 'TAKKO_JOB_WORKERS', 2)
+
+
+def _get_job_ttl():
+    return getattr(settings, 'TAKKO_JOB_TTL', 24 * 60 * 60)
+
+
+# 결과 형식을 정하지 않으면 엑셀(xlsx)로 저장한다.
+# pandas를 쓰는 pipeline은 처음 작업을 돌릴 때 불러오도록 클래스 이름만 적어 둔다.
+_takko_kinds = {
+    'order': ('TakkoOrder', {'streaming': True}, 'combined', 'xlsx'),
+    'invoice': ('TakkoInvoice', {}, 'invoice', 'xlsx'),
+}
+_output_formats = ['csv', 'parquet']
+
+_executor = None
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=_get_job_workers())
+    return _executor
+
+
+def _get_job_dir(job_id):
+    return os.path.join(_get_job_root(), str(job_id))
+
+
+def _write_status(job_dir, status, **extra):
+    status_file = os.path.join(job_dir, 'status.json')
+    with open(status_file + '.tmp', 'w') as f:
+        json.dump(dict(extra, status=status), f, ensure_ascii=False)
+    os.replace(status_file + '.tmp', status_file)
+
+
+def get_result_file_name(kind, output_format=None):
+    _, _, base_name, excel_extension = _takko_kinds[kind]
+    return '%s.%s' % (base_name, output_format or excel_extension)
+
+
+def _get_size(source):
+    return source.size if hasattr(source, 'size') else os.path.getsize(source)
+
+
+def run_takko(kind, sources, destination, output_format=None):
+    from . import pipeline
+
+    # 주문 파일이 여러 개면 TakkoOrder가 한 시트로 합친다.
+    takko_class_name, options, _, _ = _takko_kinds[kind]
+    size = sum(map(_get_size, sources))
+    workers = getattr(settings, 'TAKKO_ORDER_WORKERS', None)
+    chunk_min_bytes = getattr(settings, 'TAKKO_ORDER_CHUNK_MIN_BYTES', 16 * 2 ** 20)
+    if kind == 'order' and workers and size >= getattr(settings, 'TAKKO_ORDER_WORKERS_MIN_BYTES', 4 * 2 ** 20):
+        # 여러 프로세스로 합치도록 설정했으면 시트를 한 번에 읽고 수취인별로 나눠서 프로세스 풀에서 합친다.
+        options = dict(options, workers=workers)
+    elif kind == 'order' and chunk_min_bytes is not None and size >= chunk_min_bytes:
+        # 큰 주문 파일은 한 번에 읽지 않고 조각씩 읽으며 수취인별로 접는다.
+        options = dict(options, chunk_size=getattr(settings, 'TAKKO_ORDER_CHUNK_SIZE', 10000))
+    source = sources[0] if len(sources) == 1 else sources
+    takko = getattr(pipeline, takko_class_name)(source, **options)
+    if output_format == 'csv':
+        return takko.save_to_csv(destination)
+    if output_format == 'parquet':
+        return takko.save_to_parquet(destination)
+    return takko.save_to_excel(destination)
+
+
+def run_job(job_dir, kind, sources, cache_key=None, output_format=None):
+    # 작업 중 어디서 실패하든(캐시 읽기, 결과 저장 포함) 상태를 failed로 남긴다. 그러지 않으면 running에 머문다.
+    try:
+        _run_job(job_dir, kind, sources, cache_key, output_format)
+    except Exception as e:
+        _write_status(job_dir, 'failed', kind=kind, error=str(e))
+
+
+def _run_job(job_dir, kind, sources, cache_key, output_format):
+    file_name = get_result_file_name(kind, output_format)
+    result_file = os.path.join(job_dir, file_name)
+    _write_status(job_dir, 'running', kind=kind)
+
+    cached_file = result_cache.get(cache_key) if cache_key is not None else None
+    if cached_file is not None:
+        with cached_file, open(result_file, 'wb') as destination:
+            shutil.copyfileobj(cached_file, destination)
+        _write_status(job_dir, 'done', kind=kind, file_name=file_name)
+        return
+
+    with instrumentation.collect(kind) as records:
+        run_takko(kind, sources, result_file, output_format)
+    if cache_key is not None:
+        with open(result_file, 'rb') as fh:
+            result_cache.put(cache_key, fh)
+    _write_status(job_dir, 'done', kind=kind, file_name=file_name,
+                  timings=[record.as_dict() for record in records])
+
+
+def submit_job(kind, uploaded_files, cache_key=None, output_format=None):
+    if kind not in _takko_kinds:
+        raise ValueError('알 수 없는 작업 종류입니다: %r' % kind)
+    if output_format and output_format not in _output_formats:
+        raise ValueError('알 수 없는 결과 형식입니다: %r' % output_format)
+    purge_expired_jobs()
+
+    job_id = uuid.uuid4()
+    job_dir = _get_job_dir(job_id)
+    os.makedirs(job_dir)
+    sources = []
+    for i, uploaded_file in enumerate(uploaded_files):
+        sources.append(os.path.join(job_dir, 'upload-%d' % i))
+        with open(sources[-1], 'wb') as destination:
+            for chunk in uploaded_file.chunks():
+                destination.write(chunk)
+    _write_status(job_dir, 'pending', kind=kind)
+
+    try:
+        future = _get_executor().submit(run_job, job_dir, kind, sources, cache_key, output_format)
+    except BrokenProcessPool:
+        # 워커 프로세스가 죽어서 풀이 망가졌으면 새 풀을 만들어 다시 맡긴다.
+        _reset_executor()
+        future = _get_executor().submit(run_job, job_dir, kind, sources, cache_key, output_format)
+    future.add_done_callback(lambda future: _on_job_done(job_dir, kind, future))
+    return job_id
+
+
+def _reset_executor():
+    global _executor
+    _executor = None
+
+
+def _on_job_done(job_dir, kind, future):
+    # run_job은 예외를 밖으로 던지지 않으므로 여기로 오는 예외는 워커가 죽었거나 작업을 넘기지 못한 경우다.
+    if future.cancelled():
+        _write_status(job_dir, 'failed', kind=kind, error='작업이 취소되었습니다.')
+        return
+    error = future.exception()
+    if error is None:
+        return
+    if isinstance(error, BrokenProcessPool):
+        _reset_executor()
+    _write_status(job_dir, 'failed', kind=kind, error=str(error) or type(error).__name__)
+
+
+def get_job_status(job_id):
+    try:
+        with open(os.path.join(_get_job_dir(job_id), 'status.json')) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def get_job_result(job_id):
+    status = get_job_status(job_id)
+    if status is None or status['status'] != 'done':
+        return None
+    return os.path.join(_get_job_dir(job_id), status['file_name'])
+
+
+def purge_expired_jobs():
+    job_root = _get_job_root()
+    if not os.path.isdir(job_root):
+        return
+    expire_before = time.time() - _get_job_ttl()
+    for job_id in os.listdir(job_root):
+        job_dir = os.path.join(job_root, job_id)
+        if os.path.getmtime(job_dir) < expire_before:
+            shutil.rmtree(job_dir, ignore_errors=True)
@@ -0,0 +1,109 @@
+import re
+import unicodedata
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+
+# 같은 집으로 가는 주문이 전화번호 하이픈, 띄어쓰기, "서울시"/"서울특별시" 같은 표기 차이로 따로 포장되지 않도록
+# 수취인을 (숫자만 남긴 전화번호, 정리한 주소)로 묶는다. 키를 해시해서 묶으므로 수취인끼리 하나하나 비교하지 않는다.
+# 이름은 키에 넣지 않는다. 같은 전화번호와 주소라면 이름 표기가 달라도 한 상자로 보낸다.
+# 우편번호도 키에 넣지 않는다. 이름, 전화번호, 주소가 똑같은 행은 우편번호가 달라도 늘 한 상자로 보내고 우편번호를 모두 적는다.
+_region_aliases = {
+    '서울': ['서울특별시', '서울시'],
+    '부산': ['부산광역시', '부산시'],
+    '대구': ['대구광역시', '대구시'],
+    '인천': ['인천광역시', '인천시'],
+    '광주': ['광주광역시', '광주시'],
+    '대전': ['대전광역시', '대전시'],
+    '울산': ['울산광역시', '울산시'],
+    '세종': ['세종특별자치시', '세종시'],
+    '경기': ['경기도'],
+    '강원': ['강원도', '강원특별자치도'],
+    '충북': ['충청북도'],
+    '충남': ['충청남도'],
+    '전북': ['전라북도', '전북특별자치도'],
+    '전남': ['전라남도'],
+    '경북': ['경상북도'],
+    '경남': ['경상남도'],
+    '제주': ['제주특별자치도', '제주도'],
+}
+_regions = {alias: region for region, aliases in _region_aliases.items() for alias in aliases + [region]}
+
+# 괄호 안의 참고항목(동 이름, 건물 이름)과 쉼표는 같은 주소의 다른 표기로 본다.
+_address_notes = re.compile(r'\([^)]*\)')
+_address_separators = re.compile(r'[\s,]+')
+_non_digits = re.compile(r'\D')
+
+
+def _to_text(value):
+    if value is None or pd.isna(value):
+        return ''
+    if isinstance(value, (float, np.floating)) and float(value).is_integer():
+        value = int(value)
+    return str(value)
+
+
+def normalize_phone(phone_number):
+    return _non_digits.sub('', _to_text(phone_number))
+
+
+def normalize_zip(zip_code):
+    digits = _non_digits.sub('', _to_text(zip_code))
+    return digits.zfill(5) if digits else ''
+
+
+def canonicalize_address(address):
+    address = unicodedata.normalize('NFKC', _to_text(address))
+    tokens = [token for token in _address_separators.split(_address_notes.sub(' ', address)) if token]
+    if tokens and tokens[0] in _regions:
+        tokens[0] = _regions[tokens[0]]
+    return ' '.join(tokens[:1] + [_join_address_tokens(tokens[1:])]).strip()
+
+
+def _join_address_tokens(tokens):
+    # 띄어쓰기만 다른 주소("101동1001호", "101동 1001호")가 같아지도록 지역 다음부터는 붙여 쓴다.
+    # 다만 숫자끼리 만나는 곳은 띄운다. 그래야 "테헤란로 1, 101동"과 "테헤란로 11, 01동"이 같아지지 않는다.
+    joined = ''
+    for token in tokens:
+        if joined[-1:].isdigit() and token[0].isdigit():
+            joined += ' '
+        joined += token
+    return joined
+
+
+@lru_cache(maxsize=2 ** 16)
+def _recipient_key(name, phone_number, address):
+    phone_key = normalize_phone(phone_number)
+    if not phone_key:
+        # 전화번호가 없으면 이름, 전화번호, 주소가 똑같은 수취인끼리만 합친다.
+        return ('exact',) + tuple(None if pd.isna(value) else value for value in (name, phone_number, address))
+    return phone_key, canonicalize_address(address)
+
+
+def recipient_key(name, phone_number, address):
+    try:
+        return _recipient_key(name, phone_number, address)
+    except TypeError:
+        # 해시할 수 없는 값은 캐시 없이 계산한다.
+        return _recipient_key.__wrapped__(name, phone_number, address)
+
+
+def recipient_codes(names, phone_numbers, addresses):
+    # 행마다 수취인 번호를 붙인다. 같은 키를 가진 행은 같은 번호이고, 번호는 처음 나온 순서대로 0부터 매긴다.
+    # 키는 (이름, 전화번호, 주소)가 똑같은 행끼리 한 번만 만든다.
+    rows = pd.DataFrame({'name': names, 'phone_number': phone_numbers, 'address': addresses})
+    variants = rows.groupby(list(rows.columns), sort=False, dropna=False).ngroup().to_numpy()
+    _, first_rows, variants = np.unique(variants, return_index=True, return_inverse=True)
+
+    codes = {}
+    order = np.argsort(first_rows, kind='stable')
+    variant_codes = np.empty(len(first_rows), dtype=np.int64)
+    variant_codes[order] = [codes.setdefault(recipient_key(*row), len(codes))
+                            for row in rows.iloc[first_rows[order]].itertuples(index=False, name=None)]
+    return variant_codes[variants]
+
+
+def recipient_to_string(name, phone_number, address):
+    return ' / '.join(_to_text(value) for value in (name, phone_number, address))
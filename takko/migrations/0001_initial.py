@@ -0,0 +1,55 @@
+# Generated by Django 2.2.28 on 2026-10-18 10:16
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoredRecipient',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('phone_number', models.CharField(db_index=True, max_length=50)),
+                ('address', models.CharField(max_length=255)),
+            ],
+            options={
+                'unique_together': {('name', 'phone_number', 'address')},
+            },
+        ),
+        migrations.CreateModel(
+            name='StoredOrder',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('order_id', models.BigIntegerField(unique=True)),
+                ('recipient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='orders', to='takko.StoredRecipient')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='StoredGood',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('good_order_id', models.BigIntegerField(unique=True)),
+                ('name', models.CharField(max_length=255)),
+                ('option', models.CharField(max_length=255, null=True)),
+                ('amount', models.IntegerField(null=True)),
+                ('comment', models.TextField(null=True)),
+                ('zip_code', models.CharField(max_length=20, null=True)),
+                ('old_zip_code', models.CharField(max_length=20, null=True)),
+                ('invoice_number', models.CharField(max_length=50, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='goods', to='takko.StoredOrder')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='storedgood',
+            index=models.Index(fields=['invoice_number', 'id'], name='takko_store_invoice_e53ef7_idx'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 2.2.28 on 2026-10-18 10:17
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('takko', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoredShipment',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('phone_key', models.CharField(max_length=20)),
+                ('zip_key', models.CharField(max_length=20)),
+                ('invoice_number', models.CharField(max_length=50, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('recipient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shipments', to='takko.StoredRecipient')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='storedgood',
+            name='shipment',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='goods', to='takko.StoredShipment'),
+        ),
+        migrations.AddIndex(
+            model_name='storedshipment',
+            index=models.Index(fields=['phone_key', 'zip_key'], name='takko_store_phone_k_1c9f34_idx'),
+        ),
+    ]
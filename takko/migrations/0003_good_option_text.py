@@ -0,0 +1,18 @@
+# Generated by Django 2.2.28 on 2026-10-18 11:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('takko', '0002_shipments'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='storedgood',
+            name='option',
+            field=models.TextField(null=True),
+        ),
+    ]
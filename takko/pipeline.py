@@ -0,0 +1,867 @@
+import numpy as np
+import pandas as pd
+import csv
+import io
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from string import ascii_letters, digits
+import xlsxwriter
+
+from . import instrumentation
+from . import matching
+from . import readers
+
+
+# 주문 시트를 수취인별로 합치고 송장 시트를 일괄등록 양식으로 바꾼다.
+# pandas와 엑셀 라이브러리를 쓰므로 models와 나눠 두고, 처음 쓸 때 불러온다.
+class _cached_slot_property(object):
+    # __slots__를 쓰는 클래스용 cached_property. 처음 읽을 때 계산해서 '_이름' 슬롯에 기억해 둔다.
+    def __init__(self, func):
+        self._func = func
+
+    def __set_name__(self, owner, name):
+        self._slot = getattr(owner, '_' + name)
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        try:
+            return self._slot.__get__(instance, owner)
+        except AttributeError:
+            value = self._func(instance)
+            self._slot.__set__(instance, value)
+            return value
+
+
+class Recipient(object):
+    # 우편번호, 주문, 상품 같은 필드는 처음 쓸 때 계산한다.
+    __slots__ = ('_name', '_phone_number', '_address', '_order_columns', '_order_indices', '_indices',
+                 '_zip_code', '_old_zip_code', '_orders', '_combined_order_details', '_order_details_string',
+                 '_merged_recipients')
+
+    def __init__(self, name, phone_number, address, order_columns, order_indices, order_details_string=None):
+        self._name = name
+        self._phone_number = phone_number
+        self._address = address
+        self._order_columns = order_columns
+        self._order_indices = order_indices
+        # TakkoOrder는 모든 수취인의 주문 내역 문자열을 한꺼번에 만들어서 넘겨준다.
+        self._order_details_string = order_details_string
+
+    @classmethod
+    def from_recipient_orders(cls, order_columns, recipient_orders, order_details_strings=None):
+        # _group_recipient_orders로 미리 묶어 둔 행 번호로 모든 수취인을 한 번에 만든다.
+        # 이름, 전화번호, 주소는 수취인이 처음 나온 행의 값을 쓴다. 첫 주문의 첫 행이 그 행이다.
+        if order_details_strings is None:
+            order_details_strings = [None] * len(recipient_orders)
+        recipient_columns = [order_columns[column] for column in _recipient_columns]
+        return [cls(*[column[next(iter(order_indices.values()))[0]] for column in recipient_columns],
+                    order_columns, order_indices, order_details_string)
+                for order_indices, order_details_string in zip(recipient_orders.values(), order_details_strings)]
+
+    @property
+    def name(self):
+        return self._name
+
+    @property
+    def phone_number(self):
+        return self._phone_number
+
+    @property
+    def address(self):
+        return self._address
+
+    @_cached_slot_property
+    def indices(self):
+        return np.sort(np.concatenate(list(self._order_indices.values())))
+
+    @_cached_slot_property
+    def old_zip_code(self):
+        return self.read_old_zip_code()
+
+    @_cached_slot_property
+    def zip_code(self):
+        return self.read_zip_code()
+
+    @_cached_slot_property
+    def orders(self):
+        return self.read_orders()
+
+    def read_orders(self):
+        orders = {}
+        for order_id, indices in self._order_indices.items():
+            orders[int(order_id)] = Order(order_id, self._order_columns, indices)
+        return orders
+
+    def _unique_values(self, column):
+        return pd.unique(self._order_columns[column][self.indices])
+
+    def read_zip_code(self):
+        zip_codes = self._unique_values('수취인 우편번호')
+        if len(zip_codes) == 1:
+            return zip_codes[0]
+        return zip_codes
+
+    def read_old_zip_code(self):
+        old_zip_codes = self._unique_values('수취인 구 우편번호 (6자리)')
+        if len(old_zip_codes) == 1:
+            return old_zip_codes[0]
+        return old_zip_codes
+
+    @property
+    def combined_order_ids(self):
+        return {order_id: order.good_order_ids for order_id, order in self.orders.items()}
+
+    @_cached_slot_property
+    def combined_order_details(self):
+        return self.combine_order_details()
+
+    def combine_order_details(self):
+        combined_goods = []
+        for order in self.orders.values():
+            combined_goods += order.goods
+
+        order_details = {}
+        for good in combined_goods:
+            if good.name not in order_details.keys():
+                order_details[good.name] = {}
+
+            if good.option not in order_details[good.name].keys():
+                order_details[good.name][good.option] = good.amount
+            else:
+                order_details[good.name][good.option] += good.amount
+        return order_details
+
+    @property
+    def combined_order_details_to_string(self):
+        if self._order_details_string is not None:
+            return self._order_details_string
+
+        combined_order_details = self.combined_order_details
+        details_str = ''
+        for i, good_name in enumerate(combined_order_details):
+            if i > 0:
+                details_str += ' --- '
+
+            details_str += good_name + ': '
+
+            for j, good_option in enumerate(combined_order_details[good_name]):
+                if j > 0:
+                    details_str += ', '
+
+                if not pd.isna(good_option):
+                    details_str += good_option + ' '
+
+                good_amount = combined_order_details[good_name][good_option]
+                if not pd.isna(good_amount):
+                    details_str += str(good_amount) + '개'
+        return details_str
+
+    @property
+    def combined_comments(self):
+        comments = pd.Series(self._unique_values('주문시 남기는 글')).dropna()
+        combined_comments = ''
+        for i, comment in enumerate(comments):
+            if i > 0:
+                combined_comments += ', '
+            if len(comment) > 0:
+                combined_comments += comment
+        return combined_comments
+
+    @_cached_slot_property
+    def merged_recipients(self):
+        # 표기만 달라서 이 수취인으로 합쳐진 (이름, 전화번호, 주소)를 처음 나온 순서대로 모은다.
+        recipient = (_fold_key(self._name), _fold_key(self._phone_number), _fold_key(self._address))
+        merged_recipients = []
+        for variant in zip(*[self._order_columns[column][self.indices].tolist() for column in _recipient_columns]):
+            variant = tuple(_fold_key(value) for value in variant)
+            if variant != recipient and variant not in merged_recipients:
+                merged_recipients.append(variant)
+        return merged_recipients
+
+    @property
+    def merged_recipients_to_string(self):
+        return _merged_recipients_to_string(self.merged_recipients)
+
+
+class Order(object):
+    # 상품 목록은 처음 쓸 때 만든다. 상품주문번호만 필요하면 Good을 만들지 않는다.
+    __slots__ = ('_order_id', '_order_columns', '_indices', '_goods', '_good_order_ids', '_comments')
+
+    def __init__(self, order_id, order_columns, indices):
+        self._order_id = order_id
+        self._order_columns = order_columns
+        self._indices = indices
+
+    @property
+    def order_id(self):
+        return self._order_id
+
+    @_cached_slot_property
+    def comments(self):
+        return self.read_comments()
+
+    @_cached_slot_property
+    def goods(self):
+        return self.read_goods()
+
+    @_cached_slot_property
+    def good_order_ids(self):
+        return self.read_good_order_ids()
+
+    def read_goods(self):
+        rows = zip(*[self._order_columns[column][self._indices].tolist()
+                     for column in ['상품주문번호', '상품명', '옵션정보', '상품수량', '주문시 남기는 글']])
+        return [Good(int(good_order_id), name, option, amount, comment)
+                for good_order_id, name, option, amount, comment in rows]
+
+    def read_good_order_ids(self):
+        return [int(good_order_id) for good_order_id in self._order_columns['상품주문번호'][self._indices].tolist()]
+
+    def read_comments(self):
+        return pd.unique(self._order_columns['주문시 남기는 글'][self._indices])
+
+
+class Good(object):
+    __slots__ = ('_good_order_id', '_name', '_option', '_amount', '_comment')
+
+    def __init__(self, good_order_id, name, option, amount, comment):
+        self._good_order_id = good_order_id
+        self._name = name
+        self._option = option
+        self._amount = amount
+        self._comment = comment
+
+    @property
+    def good_order_id(self):
+        return self._good_order_id
+
+    @property
+    def name(self):
+        return self._name
+
+    @property
+    def option(self):
+        return self._option
+
+    @property
+    def amount(self):
+        return self._amount
+
+    @property
+    def comment(self):
+        return self._comment
+
+
+def _fold_key(value):
+    # 빈 값끼리 같은 키가 되도록 np.nan 하나로 맞춘다.
+    return np.nan if pd.isna(value) else value
+
+
+class FoldedRecipient(object):
+    # 시트를 조각으로 나눠 읽을 때 한 수취인의 행을 차례로 접어 둔다. 내보낼 때는 Recipient와 같은 필드를 쓴다.
+    # 행을 쌓아 두지 않고 들어오는 대로 주문별 상품주문번호와 상품명, 옵션별 수량 합계에 더한다.
+    __slots__ = ('_name', '_phone_number', '_address', '_zip_codes', '_old_zip_codes', '_comments', '_orders',
+                 '_details', '_merged_recipients')
+
+    def __init__(self, name, phone_number, address):
+        self._name = name
+        self._phone_number = phone_number
+        self._address = address
+        # 처음 나온 순서대로 중복 없이 모은다. 대부분 값이 하나뿐이라 튜플로 둔다.
+        self._zip_codes = ()
+        self._old_zip_codes = ()
+        self._comments = ()
+        self._merged_recipients = ()
+        # {주문 번호: (주문 순번, [상품주문번호])}
+        self._orders = {}
+        # {(상품명, 옵션정보): (주문 순번, 주문 안의 행 순번, 상품수량 합계)}
+        # 순번은 처음 나온 자리다. 주문 번호가 흩어져 나와도 Recipient와 같은 순서로 내보내려고 둔다.
+        self._details = {}
+
+    def add_recipient(self, name, phone_number, address):
+        variant = (name, phone_number, address)
+        if variant != (self._name, self._phone_number, self._address) and variant not in self._merged_recipients:
+            self._merged_recipients += (variant,)
+
+    def add_good(self, order_id, good_order_id, name, option, amount, comment, zip_code, old_zip_code):
+        zip_code = _fold_key(zip_code)
+        if zip_code not in self._zip_codes:
+            self._zip_codes += (zip_code,)
+        old_zip_code = _fold_key(old_zip_code)
+        if old_zip_code not in self._old_zip_codes:
+            self._old_zip_codes += (old_zip_code,)
+        if not pd.isna(comment) and comment not in self._comments:
+            self._comments += (comment,)
+        order = self._orders.get(int(order_id))
+        if order is None:
+            order = self._orders[int(order_id)] = (len(self._orders), [])
+        order_rank, good_order_ids = order
+        row = len(good_order_ids)
+        good_order_ids.append(int(good_order_id))
+
+        key = (_fold_key(name), _fold_key(option))
+        detail = self._details.get(key)
+        if detail is None:
+            self._details[key] = (order_rank, row, amount)
+        else:
+            self._details[key] = min(detail[:2], (order_rank, row)) + (detail[2] + amount,)
+
+    @property
+    def name(self):
+        return self._name
+
+    @property
+    def phone_number(self):
+        return self._phone_number
+
+    @property
+    def address(self):
+        return self._address
+
+    @staticmethod
+    def _unique_value(values):
+        # Recipient.read_zip_code처럼 값이 하나면 그 값을, 여럿이면 배열을 돌려준다.
+        if len(values) == 1:
+            return values[0]
+        return pd.Series(values).to_numpy()
+
+    @property
+    def old_zip_code(self):
+        return self._unique_value(self._old_zip_codes)
+
+    @property
+    def zip_code(self):
+        return self._unique_value(self._zip_codes)
+
+    @property
+    def combined_order_ids(self):
+        return {order_id: good_order_ids for order_id, (_, good_order_ids) in self._orders.items()}
+
+    @property
+    def combined_order_details_to_string(self):
+        # Recipient.combine_order_details처럼 주문 순서, 주문 안에서는 행 순서로 처음 나온 상품명과 옵션 순서를 따른다.
+        # 상품명이 처음 나온 자리는 그 상품명의 옵션 중 가장 앞선 자리이므로, 옵션을 자리 순으로 늘어놓고 상품명별로 모으면 된다.
+        combined_order_details = {}
+        for (name, option), (_, _, amount) in sorted(self._details.items(), key=lambda item: item[1][:2]):
+            combined_order_details.setdefault(name, []).append(('' if pd.isna(option) else '%s ' % option)
+                                                               + ('' if pd.isna(amount) else '%s개' % amount))
+        return ' --- '.join('%s: %s' % (name, ', '.join(options)) for name, options in combined_order_details.items())
+
+    @property
+    def combined_comments(self):
+        return ', '.join(self._comments)
+
+    @property
+    def merged_recipients(self):
+        return list(self._merged_recipients)
+
+    @property
+    def merged_recipients_to_string(self):
+        return _merged_recipients_to_string(self._merged_recipients)
+
+
+class TakkoOrder(object):
+    _out_columns = ['수취인 이름', '수취인 핸드폰 번호', '수취인 전체주소',
+                    '수취인 구 우편번호 (6자리)', '수취인 우편번호',
+                    '상품주문번호 리스트', '주문 내역', '주문시 남기는 글', '합친 수취인']
+
+    def __init__(self, file_dir, streaming=False, chunk_size=None, workers=None):
+        if chunk_size is not None and not isinstance(file_dir, pd.DataFrame):
+            # 시트 전체를 DataFrame으로 읽지 않고, 수취인을 꺼낼 때 chunk_size행씩 읽으며 수취인별로 접는다.
+            self._sources = list(file_dir) if isinstance(file_dir, (list, tuple)) else [file_dir]
+            self._chunk_size = chunk_size
+            self._takko_order_df = None
+        else:
+            self._sources = None
+            with instrumentation.stage('read') as record:
+                if isinstance(file_dir, pd.DataFrame):
+                    self._takko_order_df = file_dir
+                elif isinstance(file_dir, (list, tuple)):
+                    self._takko_order_df = self._read_sheet_files(file_dir)
+                else:
+                    self._takko_order_df = self._read_sheet_file(file_dir)
+                record.rows = len(self._takko_order_df)
+        self._streaming = streaming
+        # workers가 2 이상이면 수취인별로 나눈 시트 조각을 프로세스 풀에서 합친다. 조각씩 읽을 때는 쓰지 않는다.
+        self._workers = workers if workers is not None and workers > 1 and self._sources is None else None
+        # 수취인 묶기(group, 조각씩 읽을 때는 fold)와 주문 내역 만들기(details)는 _iter_recipients가 단계로 잰다.
+        # 스트리밍 모드에서는 이 단계들이 write 단계 안에서 일어나므로 write 시간에도 함께 들어간다.
+        if not streaming and self._workers is not None:
+            self._recipients = None
+            self._combined_orders_df = pd.DataFrame(list(self._iter_rows()), columns=self._out_columns, dtype=object)
+        elif not streaming:
+            self._recipients = self._get_unique_recipients()
+            with instrumentation.stage('combine') as record:
+                self._combined_orders_df = self.combine_all_orders()
+                record.rows = len(self._combined_orders_df)
+
+    @staticmethod
+    def _read_sheet_file(file_dir):
+        return readers.read_sheet_file(file_dir, columns=_recipient_columns + ['주문 번호'] + _order_columns,
+                                       dtype=_order_dtypes)
+
+    @staticmethod
+    def _read_sheet_files(file_dirs):
+        # 여러 내보내기 파일을 프로세스 풀에서 나눠 읽고, 파일 순서대로 이어 붙인 뒤 상품주문번호가 겹치는 행은 처음 것만 남긴다.
+        contents = [_read_bytes(file_dir) for file_dir in file_dirs]
+        with ProcessPoolExecutor(max_workers=min(len(contents), os.cpu_count() or 1)) as executor:
+            dfs = list(executor.map(_read_order_sheet_bytes, contents))
+        df = pd.concat(dfs, ignore_index=True)
+        duplicated = df.duplicated('상품주문번호') & df['상품주문번호'].notna()
+        return df[~duplicated].reset_index(drop=True)
+
+    def _get_unique_recipients(self):
+        return list(self._iter_recipients())
+
+    def _iter_recipients(self, recipient_codes=None):
+        if self._sources is not None:
+            yield from self._fold_recipients()
+            return
+        order_columns = {column: self._takko_order_df[column].to_numpy()
+                         for column in _recipient_columns + _order_columns}
+        with instrumentation.stage('group') as record:
+            recipient_orders = _group_recipient_orders(self._takko_order_df, recipient_codes)
+            record.rows = len(recipient_orders)
+        with instrumentation.stage('details') as record:
+            order_details_strings = _combine_order_details(self._takko_order_df, recipient_orders)
+            record.rows = len(order_details_strings)
+        yield from Recipient.from_recipient_orders(order_columns, recipient_orders, order_details_strings)
+
+    def _fold_recipients(self):
+        # 조각씩 읽는 시간도 fold 단계에 들어간다. 이 모드에는 read 단계가 따로 없다.
+        with instrumentation.stage('fold') as record:
+            recipients = self._fold_sources()
+            record.rows = len(recipients)
+        yield from recipients.values()
+
+    def _fold_sources(self):
+        recipients = {}
+        # 여러 파일을 합칠 때는 _read_sheet_files처럼 앞 파일에서 나온 상품주문번호는 건너뛴다.
+        seen_good_order_ids = set() if len(self._sources) > 1 else None
+        for source in self._sources:
+            chunks = readers.iter_sheet_chunks(source, self._chunk_size,
+                                               columns=_recipient_columns + ['주문 번호'] + _order_columns,
+                                               dtype=_order_dtypes)
+            for chunk in chunks:
+                rows = zip(*[chunk[column].tolist() for column in _recipient_columns + ['주문 번호'] + _order_columns])
+                for name, phone_number, address, order_id, good_order_id, *good in rows:
+                    if seen_good_order_ids is not None and not pd.isna(good_order_id):
+                        if good_order_id in seen_good_order_ids:
+                            continue
+                        seen_good_order_ids.add(good_order_id)
+
+                    # _group_recipient_orders와 같은 키로 묶고, 처음 나온 표기를 수취인으로 쓴다.
+                    variant = (_fold_key(name), _fold_key(phone_number), _fold_key(address))
+                    key = matching.recipient_key(*variant)
+                    recipient = recipients.get(key)
+                    if recipient is None:
+                        recipient = recipients[key] = FoldedRecipient(*variant)
+                    else:
+                        recipient.add_recipient(*variant)
+                    recipient.add_good(order_id, good_order_id, *good)
+        return recipients
+
+    def _combine_in_parallel(self):
+        # 수취인 번호를 workers로 나눈 나머지로 시트를 나눈다. 한 수취인의 행은 모두 한 조각에 원래 순서대로 들어간다.
+        # 조각에는 필요한 열과 그 조각의 행, 행마다 전체 시트에서 매긴 수취인 번호만 담아서 보낸다.
+        # 조각은 그 번호로 묶은 행을 번호별로 돌려주므로, 번호 순서대로 다시 엮으면 한 번에 처리한 결과와 같다.
+        # 조각 안의 group, details 단계는 다른 프로세스에서 돌아서 잡히지 않으므로 풀 전체를 combine 단계로 잰다.
+        dataframe = self._takko_order_df[_recipient_columns + ['주문 번호'] + _order_columns]
+        with instrumentation.stage('group') as record:
+            recipient_codes = _get_recipient_codes(dataframe)
+            record.rows = recipient_codes.max() + 1 if len(recipient_codes) else 0
+        partitions = [np.flatnonzero(recipient_codes % self._workers == partition) for partition in range(self._workers)]
+        with instrumentation.stage('combine') as record:
+            with ProcessPoolExecutor(max_workers=self._workers) as executor:
+                results = executor.map(_combine_order_partition,
+                                       [dataframe.iloc[rows].reset_index(drop=True) for rows in partitions],
+                                       [recipient_codes[rows] for rows in partitions])
+                combined_orders = {}
+                for result in results:
+                    combined_orders.update(result)
+            record.rows = len(combined_orders)
+        for recipient_code in range(len(combined_orders)):
+            yield combined_orders[recipient_code]
+
+    @property
+    def out_columns(self):
+        return list(self._out_columns)
+
+    def iter_combined_orders(self):
+        # 합친 시트를 파일로 쓰지 않고 한 행씩 꺼낸다. 행의 값은 out_columns 순서다.
+        if self._streaming:
+            return self._iter_rows()
+        return (list(row) for row in self._combined_orders_df.itertuples(index=False))
+
+    def _iter_rows(self):
+        if self._workers is not None:
+            return self._combine_in_parallel()
+        return self._iter_combined_orders(self._iter_recipients())
+
+    @staticmethod
+    def _iter_combined_orders(recipients):
+        for recipient in recipients:
+            yield [recipient.name,
+                   recipient.phone_number,
+                   recipient.address,
+                   recipient.old_zip_code,
+                   recipient.zip_code,
+                   json.dumps(recipient.combined_order_ids),
+                   recipient.combined_order_details_to_string,
+                   recipient.combined_comments,
+                   recipient.merged_recipients_to_string]
+
+    def combine_all_orders(self, recipients=None):
+        # recipients를 주면 이미 묶어 둔 수취인 대신 그 수취인들로 합친다.
+        recipients = self._recipients if recipients is None else recipients
+        combined_orders = list(self._iter_combined_orders(recipients))
+        return pd.DataFrame(combined_orders, columns=self._out_columns, dtype=object)
+
+    def save_to_excel(self, file_name='combined.xlsx'):
+        # 스트리밍 모드에서는 수취인 묶기와 주문 합치기도 이 단계 안에서 일어난다.
+        with instrumentation.stage('write') as record:
+            if self._streaming:
+                record.rows = self._stream_to_excel(file_name)
+            else:
+                self._write_excel(file_name)
+                record.rows = len(self._combined_orders_df)
+        return file_name
+
+    def save_to_csv(self, file_name='combined.csv'):
+        with instrumentation.stage('write') as record:
+            if self._streaming:
+                rows = self._iter_rows()
+            else:
+                rows = self._combined_orders_df.itertuples(index=False)
+            record.rows = _write_csv(file_name, self._out_columns, rows)
+        return file_name
+
+    def save_to_parquet(self, file_name='combined.parquet'):
+        with instrumentation.stage('write') as record:
+            if self._streaming:
+                combined_orders_df = pd.DataFrame(list(self._iter_rows()),
+                                                  columns=self._out_columns, dtype=object)
+            else:
+                combined_orders_df = self._combined_orders_df
+            _write_parquet(file_name, combined_orders_df)
+            record.rows = len(combined_orders_df)
+        return file_name
+
+    def _write_excel(self, file_name):
+        dfs = {'주문 내역 정리': self._combined_orders_df}
+        writer = pd.ExcelWriter(file_name, engine='xlsxwriter')
+        for sheetname, df in dfs.items():  # loop through `dict` of dataframes
+            df.to_excel(writer, sheet_name=sheetname, index=False)  # send df to writer
+            worksheet = writer.sheets[sheetname]  # pull worksheet object
+
+            for idx, col in enumerate(df):  # loop through all columns
+                series = df[col]
+                max_len = max(
+                    series.astype(str).map(visual_len).max(),  # len of largest item
+                    visual_len(str(series.name))  # len of column name/header
+                )
+                worksheet.set_column(idx, idx, max_len)  # set column width
+
+        writer.save()
+
+    def _stream_to_excel(self, file_name):
+        # 수취인을 하나씩 만들면서 바로 행을 쓴다.
+        combined_orders = self._iter_rows()
+        return _stream_rows_to_excel(file_name, '주문 내역 정리', self._out_columns, combined_orders)
+
+
+def _combine_order_partition(dataframe, recipient_codes):
+    # 프로세스 풀에서 시트 조각 하나를 보통 경로로 합친다. 수취인은 넘겨받은 번호로 묶고, {수취인 번호: 행}으로 돌려준다.
+    takko_order = TakkoOrder(dataframe, streaming=True)
+    rows = takko_order._iter_combined_orders(takko_order._iter_recipients(recipient_codes))
+    return dict(zip(pd.unique(recipient_codes).tolist(), rows))
+
+
+def _read_bytes(file_dir):
+    if hasattr(file_dir, 'read'):
+        file_dir.seek(0)
+        return file_dir.read()
+    with open(file_dir, 'rb') as f:
+        return f.read()
+
+
+def _read_order_sheet_bytes(content):
+    return TakkoOrder._read_sheet_file(io.BytesIO(content))
+
+
+def _to_excel_value(value):
+    # DataFrame.to_excel과 같은 방식으로 셀 값을 변환한다.
+    if not pd.api.types.is_scalar(value):
+        return str(value)
+    if pd.isna(value):
+        return None
+    if isinstance(value, np.integer):
+        return int(value)
+    if isinstance(value, np.floating):
+        return float(value)
+    return value
+
+
+def _stream_rows_to_excel(file_name, sheet_name, columns, rows):
+    # 행을 쓰는 즉시 내보내고 열 너비는 쓰는 동안 최댓값만 기억한다. 쓴 행 수를 돌려준다.
+    workbook = xlsxwriter.Workbook(file_name, {'constant_memory': True})
+    worksheet = workbook.add_worksheet(sheet_name)
+    header_format = workbook.add_format({'bold': True, 'border': 1, 'align': 'center', 'valign': 'top'})
+
+    max_lens = []
+    for idx, column in enumerate(columns):
+        worksheet.write(0, idx, column, header_format)
+        max_lens.append(visual_len(column))
+
+    row_idx = 0
+    for row_idx, row in enumerate(rows, start=1):
+        for idx, value in enumerate(row):
+            # 빈 셀은 쓰지 않아도 결과가 같다.
+            excel_value = _to_excel_value(value)
+            if excel_value is not None:
+                worksheet.write(row_idx, idx, excel_value)
+            max_lens[idx] = max(max_lens[idx], visual_len(str(value)))
+
+    for idx, max_len in enumerate(max_lens):
+        worksheet.set_column(idx, idx, max_len)
+    workbook.close()
+    return row_idx
+
+
+def _write_csv(file_name, columns, rows):
+    # 한글 엑셀에서 바로 열리도록 BOM을 붙인 UTF-8로 쓴다. 쓴 행 수를 돌려준다.
+    if hasattr(file_name, 'write'):
+        f = io.TextIOWrapper(file_name, encoding='utf-8-sig', newline='')
+    else:
+        f = open(file_name, 'w', encoding='utf-8-sig', newline='')
+    writer = csv.writer(f)
+    writer.writerow(columns)
+    row_count = 0
+    for row in rows:
+        writer.writerow([_to_excel_value(value) for value in row])
+        row_count += 1
+    if hasattr(file_name, 'write'):
+        # 감싼 버퍼는 호출한 쪽에서 계속 써야 하므로 닫지 않고 떼어 낸다.
+        f.flush()
+        f.detach()
+    else:
+        f.close()
+    return row_count
+
+
+def _write_parquet(file_name, df):
+    # 문자열과 숫자가 섞인 object 열(우편번호 등)은 pyarrow가 변환하지 못하므로 문자열로 맞춘다.
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        raise Exception('Parquet 파일로 저장하려면 pyarrow를 설치해야 합니다.')
+    df = df.infer_objects()
+    for column in df.columns:
+        if df[column].dtype == object:
+            df[column] = [None if pd.api.types.is_scalar(value) and pd.isna(value) else str(value)
+                          for value in df[column]]
+    df.to_parquet(file_name, engine='pyarrow', index=False)
+
+
+_recipient_columns = ['수취인 이름', '수취인 핸드폰 번호', '수취인 전체주소']
+_order_id_dtypes = {'상품주문번호': 'Int64', '주문 번호': 'Int64'}
+# 조각씩 읽으면 열의 dtype이 조각마다 정해지므로, 빈 칸 하나로 바뀌는 열은 파일 전체에 같은 dtype을 준다.
+# 상품수량이 float이 되면 '2.0개'가 되고, 우편번호는 앞의 0이 남도록 글자 그대로 읽는다.
+_order_dtypes = dict(_order_id_dtypes, **{'상품수량': 'Int64', '수취인 우편번호': str, '수취인 구 우편번호 (6자리)': str})
+_order_columns = ['상품주문번호', '상품명', '옵션정보', '상품수량', '주문시 남기는 글',
+                  '수취인 우편번호', '수취인 구 우편번호 (6자리)']
+
+
+def read_order_sheet(file_dir):
+    # 주문 시트 파일을 TakkoOrder가 읽는 것과 같은 열과 dtype으로 읽는다.
+    return TakkoOrder._read_sheet_file(file_dir)
+
+
+def to_order_sheet(orders_df):
+    # 시트 파일이 아닌 곳(JSON API)에서 받은 주문 행을 _read_sheet_file로 읽은 시트와 같은 열과 dtype으로 맞춘다.
+    # 빠진 선택 열은 빈 값으로 채운다. 합치는 도중에 실패하지 않도록 맞출 수 없는 값이 있으면 미리 ValueError를 던진다.
+    orders_df = orders_df.reindex(columns=_recipient_columns + ['주문 번호'] + _order_columns)
+    for column in orders_df:
+        if not all(pd.api.types.is_scalar(value) for value in orders_df[column]):
+            raise ValueError('%s 열의 값은 배열이나 객체가 아니어야 합니다.' % column)
+    # pd.to_numeric은 true를 1로 바꾸므로 정수 열의 불리언은 먼저 걸러 낸다.
+    for column in [column for column, dtype in _order_dtypes.items() if dtype == 'Int64']:
+        if any(isinstance(value, (bool, np.bool_)) for value in orders_df[column]):
+            raise ValueError('%s 열의 값은 true, false가 아니라 정수여야 합니다.' % column)
+    try:
+        for column, dtype in _order_id_dtypes.items():
+            orders_df[column] = pd.to_numeric(orders_df[column]).astype(dtype)
+        orders_df['상품수량'] = pd.to_numeric(orders_df['상품수량']).astype(_order_dtypes['상품수량'])
+    except (TypeError, ValueError) as e:
+        raise ValueError('주문 번호, 상품주문번호와 상품수량은 정수여야 합니다: %s' % e)
+    for column in _order_id_dtypes:
+        if orders_df[column].isna().any():
+            raise ValueError('%s 열이 비어 있는 행이 있습니다.' % column)
+    for column in ['주문시 남기는 글'] + [column for column, dtype in _order_dtypes.items() if dtype is str]:
+        values = orders_df[column]
+        orders_df[column] = values.astype(object).where(values.isna(), values.astype(str))
+    return orders_df
+
+
+def _get_recipient_codes(dataframe):
+    return matching.recipient_codes(*[dataframe[column].to_numpy() for column in _recipient_columns])
+
+
+def _group_recipient_orders(dataframe, recipient_codes=None):
+    # (수취인, 주문 번호) 기준으로 한 번만 묶어서 {수취인 번호: {주문 번호: 행 번호 배열}}을 돌려준다.
+    # 수취인은 matching.recipient_key가 같으면 같은 사람으로 보고, 수취인과 주문 모두 처음 나온 순서를 유지한다.
+    # recipient_codes를 주면 수취인 번호를 새로 매기지 않고 그 번호로 묶는다.
+    # groupby(sort=False).indices는 열별 코드 순서로 나오므로 묶음마다 첫 행 번호로 다시 정렬한다.
+    if recipient_codes is None:
+        recipient_codes = _get_recipient_codes(dataframe)
+    keys = pd.DataFrame({'recipient': recipient_codes, 'order': dataframe['주문 번호'].array})
+    recipient_orders = {}
+    grouped = keys.groupby(['recipient', 'order'], sort=False, dropna=False)
+    for (recipient_code, order_id), indices in sorted(grouped.indices.items(), key=lambda item: item[1][0]):
+        recipient_orders.setdefault(recipient_code, {})[order_id] = indices
+    return recipient_orders
+
+
+def _merged_recipients_to_string(merged_recipients):
+    return ' --- '.join(matching.recipient_to_string(*recipient) for recipient in merged_recipients)
+
+
+def _combine_order_details(dataframe, recipient_orders):
+    # 수취인별 (상품명, 옵션정보)마다 상품수량을 더해서 '주문 내역' 문자열을 한꺼번에 만든다.
+    # 상품명과 옵션은 Recipient.combine_order_details처럼 주문 순서, 주문 안에서는 행 순서로 처음 나온 순서를 따른다.
+    sequences = [np.concatenate(list(order_indices.values())) for order_indices in recipient_orders.values()]
+    if not sequences:
+        return []
+    sequence = np.concatenate(sequences)
+    goods = pd.DataFrame({'recipient': np.repeat(np.arange(len(sequences)), [len(indices) for indices in sequences]),
+                          'name': dataframe['상품명'].iloc[sequence].to_numpy(),
+                          'option': dataframe['옵션정보'].iloc[sequence].to_numpy(),
+                          'amount': dataframe['상품수량'].iloc[sequence].reset_index(drop=True),
+                          'missing': dataframe['상품수량'].iloc[sequence].isna().to_numpy()})
+
+    # 수량이 하나라도 비어 있으면 합계도 비어 있는 것으로 본다.
+    details = (goods.groupby(['recipient', 'name', 'option'], sort=False, dropna=False)
+               .agg({'amount': 'sum', 'missing': 'any'}).reset_index())
+    if details['missing'].any():
+        details['amount'] = details['amount'].where(~details['missing'])
+    name_order = details.groupby(['recipient', 'name'], sort=False, dropna=False).ngroup().to_numpy()
+    sort_order = np.argsort(name_order, kind='stable')
+    details = details.iloc[sort_order]
+
+    options = details['option'].astype(object)
+    amounts = details['amount'].astype(object)
+    option_strings = ((options.astype(str) + ' ').mask(options.isna(), '')
+                      + (amounts.astype(str) + '개').mask(amounts.isna(), '')).tolist()
+
+    # 정렬한 뒤에는 같은 (수취인, 상품명)과 같은 수취인이 연속해 있으므로 경계마다 잘라서 잇는다.
+    name_starts = _run_starts(name_order[sort_order])
+    name_strings = ['%s: %s' % (name, ', '.join(option_strings[start:end]))
+                    for name, start, end in zip(details['name'].to_numpy()[name_starts[:-1]],
+                                                name_starts[:-1], name_starts[1:])]
+    recipient_starts = _run_starts(details['recipient'].to_numpy()[name_starts[:-1]])
+    return [' --- '.join(name_strings[start:end]) for start, end in zip(recipient_starts[:-1], recipient_starts[1:])]
+
+
+def _run_starts(values):
+    # 같은 값이 이어지는 구간의 시작 위치와 끝 위치(len(values))를 돌려준다.
+    return np.concatenate([[0], np.flatnonzero(values[1:] != values[:-1]) + 1, [len(values)]]).tolist()
+
+
+class TakkoInvoice(object):
+    _default_columns = ['번호', '상품주문번호', '주문번호', '배송업체번호', '송장번호', '배송일', '배송완료일']
+    _invoice_column_candidates = ['운송장', '운송장번호', '운송장 번호', '송장', '송장번호', '송장 번호']
+
+    def __init__(self, file_dir):
+        with instrumentation.stage('read') as record:
+            if isinstance(file_dir, pd.DataFrame):
+                self._invoice_df = file_dir
+            else:
+                self._invoice_df = self._read_sheet_file(file_dir)
+            record.rows = len(self._invoice_df)
+        if '상품주문번호 리스트' not in self._invoice_df:
+            raise Exception('"상품주문번호 리스트" 열이 존재하지 않습니다.')
+
+        has_invoice_column = False
+        for column_name in self._invoice_df.columns:
+            if column_name in self._invoice_column_candidates:
+                has_invoice_column = True
+                self._invoice_column = column_name
+                break
+        if not has_invoice_column:
+            raise Exception('운송장번호를 찾을 수 없습니다. 운송장번호를 나타내는 열이 %r 이 중 '
+                            '최소 하나의 이름과 일치하여야 합니다.' % self._invoice_column_candidates)
+
+        with instrumentation.stage('convert') as record:
+            self._converted_invoice_df = self._convert_invoice_form()
+            record.rows = len(self._converted_invoice_df)
+
+    @classmethod
+    def _read_sheet_file(cls, file_dir):
+        return readers.read_sheet_file(file_dir, columns=['상품주문번호 리스트'] + cls._invoice_column_candidates,
+                                       dtype={'상품주문번호 리스트': str})
+
+    @property
+    def converted_invoice_df(self):
+        return self._converted_invoice_df
+
+    @staticmethod
+    def _read_combined_order_ids(combined_order_ids_column):
+        # 모든 셀의 JSON을 한 번에 파싱해서 (주문번호, 상품주문번호) 열과 행별 상품 개수로 펼친다.
+        combined_order_ids = json.loads('[%s]' % ','.join(combined_order_ids_column))
+        order_ids = []
+        good_order_ids = []
+        counts = []
+        for order_ids_by_recipient in combined_order_ids:
+            count = 0
+            for order_id, ids in order_ids_by_recipient.items():
+                order_ids += [order_id] * len(ids)
+                good_order_ids += ids
+                count += len(ids)
+            counts.append(count)
+        return order_ids, good_order_ids, counts
+
+    def _convert_invoice_form(self):
+        order_ids, good_order_ids, counts = self._read_combined_order_ids(self._invoice_df['상품주문번호 리스트'])
+        converted_invoice = pd.DataFrame({'번호': np.arange(1, len(good_order_ids) + 1),
+                                          '상품주문번호': good_order_ids,
+                                          '주문번호': order_ids,
+                                          '송장번호': np.repeat(self._invoice_df[self._invoice_column].to_numpy(), counts)},
+                                         dtype=object)
+        converted_invoice = converted_invoice.reindex(columns=self._default_columns)
+        return converted_invoice
+
+    def save_to_excel(self, file_name='invoice.xlsx'):
+        # 네이버 송장 일괄등록은 xlsx도 받는다. xlwt(.xls)는 65,536행 제한이 있고 느려서 쓰지 않는다.
+        with instrumentation.stage('write') as record:
+            record.rows = _stream_rows_to_excel(file_name, '송장 번호 일괄등록', self._converted_invoice_df.columns,
+                                                self._converted_invoice_df.itertuples(index=False))
+        return file_name
+
+    def save_to_csv(self, file_name='invoice.csv'):
+        with instrumentation.stage('write') as record:
+            record.rows = _write_csv(file_name, self._converted_invoice_df.columns,
+                                     self._converted_invoice_df.itertuples(index=False))
+        return file_name
+
+    def save_to_parquet(self, file_name='invoice.parquet'):
+        with instrumentation.stage('write') as record:
+            _write_parquet(file_name, self._converted_invoice_df)
+            record.rows = len(self._converted_invoice_df)
+        return file_name
+
+
+_ascii_alnum_table = str.maketrans('', '', ascii_letters + digits)
+
+
+@lru_cache(maxsize=2 ** 16)
+def visual_len(string):
+    # 정규식 \w 중 ASCII 영숫자가 아닌 글자(한글 등, '_' 포함)를 넓은 글자로 센다.
+    string_length = len(string)
+    if string.isascii():
+        korean_length = string.count('_')
+    else:
+        korean_length = sum(c.isalnum() or c == '_' for c in string.translate(_ascii_alnum_table))
+    return string_length + korean_length * 0.75 + 1
@@ -0,0 +1,224 @@
+import re
+
+import numpy as np
+import pandas as pd
+from pandas.io.parsers import TextParser
+
+
+# 파일 앞부분의 시그니처로 형식을 판별해서 맞는 파서로 바로 보낸다. 네이버의 .xls는 실제로는 HTML인 경우가 많다.
+_xlsx_signature = b'PK\x03\x04'
+_xls_signature = b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1'
+_utf8_bom = b'\xef\xbb\xbf'
+_parquet_signature = b'PAR1'
+
+
+def _read_head(file_dir, size=512):
+    if hasattr(file_dir, 'read'):
+        file_dir.seek(0)
+        head = file_dir.read(size)
+        file_dir.seek(0)
+        return head
+    with open(file_dir, 'rb') as f:
+        return f.read(size)
+
+
+def sniff_format(file_dir):
+    head = _read_head(file_dir)
+    if head.startswith(_xlsx_signature):
+        return 'xlsx'
+    if head.startswith(_xls_signature):
+        return 'xls'
+    if head.startswith(_parquet_signature):
+        return 'parquet'
+    if head.startswith(_utf8_bom):
+        head = head[len(_utf8_bom):]
+    if head.lstrip().startswith(b'<'):
+        return 'html'
+    return 'csv'
+
+
+def read_sheet_file(file_dir, columns=None, dtype=None):
+    # columns에 없는 열은 읽지 않는다. 시트에 없는 열이 columns에 있어도 오류로 보지 않는다.
+    usecols = None if columns is None else (lambda column: column in columns)
+    sheet_format = sniff_format(file_dir)
+
+    if sheet_format == 'xlsx':
+        return pd.read_excel(file_dir, engine='openpyxl', usecols=usecols, dtype=dtype)
+    if sheet_format == 'xls':
+        return pd.read_excel(file_dir, engine='xlrd', usecols=usecols, dtype=dtype)
+    if sheet_format == 'csv':
+        return pd.read_csv(file_dir, usecols=usecols, dtype=dtype, encoding='utf-8-sig')
+
+    if sheet_format == 'parquet':
+        df = _read_parquet(file_dir, columns)
+    else:
+        # 문서에 문자셋이 적혀 있지 않으면 UTF-8로 본다.
+        encoding = None if b'charset' in _read_head(file_dir, 4096).lower() else 'utf-8'
+        # 문자열로 읽을 열은 숫자로 바꾸지 않고 셀 글자 그대로 둔다. 그래야 우편번호와 전화번호 앞의 0이 남는다.
+        converters = {column: str for column, column_dtype in (dtype or {}).items() if column_dtype is str}
+        df = pd.read_html(file_dir, header=0, encoding=encoding, converters=converters or None)[0]
+        if dtype is not None:
+            dtype = {column: column_dtype for column, column_dtype in dtype.items() if column not in converters}
+    if columns is not None:
+        df = df[[column for column in df.columns if column in columns]]
+    if dtype is not None:
+        df = _astype(df, dtype)
+    return df
+
+
+def _astype(df, dtype):
+    # 문자열로 바꿀 열의 빈 칸은 'nan'이 되지 않도록 빈 값으로 둔다. read_csv, read_excel과 같다.
+    # 빈 칸이 있어 실수가 된 정수 열은 read_excel처럼 정수로 적는다. 그래야 조각마다 '10001'과 '10001.0'으로 갈리지 않는다.
+    missing = {column: df[column].isna() for column, column_dtype in dtype.items()
+               if column_dtype is str and column in df}
+    for column in missing:
+        if df[column].dtype.kind == 'f':
+            df[column] = pd.Series([int(value) if value.is_integer() else value for value in df[column].tolist()],
+                                   index=df.index, dtype=object)
+    df = df.astype({column: dtype[column] for column in dtype if column in df})
+    for column, column_missing in missing.items():
+        df[column] = df[column].where(~column_missing)
+    return df
+
+
+def _read_parquet(file_dir, columns=None):
+    # pyarrow는 Parquet을 쓸 때만 필요하므로 여기서 불러온다.
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise Exception('Parquet 파일을 읽으려면 pyarrow를 설치해야 합니다.')
+    if hasattr(file_dir, 'seek'):
+        file_dir.seek(0)
+    parquet_file = pq.ParquetFile(file_dir)
+    if columns is not None:
+        columns = [column for column in parquet_file.schema_arrow.names if column in columns]
+    return parquet_file.read(columns=columns).to_pandas()
+
+
+# 아주 큰 주문 시트는 한 번에 읽지 않고 chunk_size행씩 잘라 DataFrame으로 넘긴다.
+# 값 변환은 read_sheet_file과 같게 TextParser로 하지만, dtype을 주지 않은 열의 dtype은 조각마다 따로 정해진다.
+_html_whitespace = re.compile(r'[\r\n]+|\s{2,}')
+
+
+def iter_sheet_chunks(file_dir, chunk_size, columns=None, dtype=None):
+    usecols = None if columns is None else (lambda column: column in columns)
+    sheet_format = sniff_format(file_dir)
+
+    if sheet_format == 'csv':
+        if hasattr(file_dir, 'seek'):
+            file_dir.seek(0)
+        yield from pd.read_csv(file_dir, usecols=usecols, dtype=dtype, encoding='utf-8-sig', chunksize=chunk_size)
+        return
+    if sheet_format == 'parquet':
+        yield from _iter_parquet_chunks(file_dir, chunk_size, columns, dtype)
+        return
+    if sheet_format == 'xls':
+        # xlrd는 어차피 파일 전체를 읽으므로 다 읽은 뒤 잘라서 넘긴다.
+        df = read_sheet_file(file_dir, columns=columns, dtype=dtype)
+        for start in range(0, len(df), chunk_size):
+            yield df.iloc[start:start + chunk_size]
+        return
+
+    if sheet_format == 'xlsx':
+        rows = _iter_xlsx_rows(file_dir)
+        parser_options = {}
+    else:
+        rows = _iter_html_rows(file_dir)
+        parser_options = {'thousands': ','}
+    header = next(rows, None)
+    if header is None:
+        return
+    chunk = []
+    for row in rows:
+        # 값이 하나도 없는 행은 건너뛴다.
+        if any(value != '' for value in row):
+            chunk.append((row + [''] * (len(header) - len(row)))[:len(header)])
+        if len(chunk) >= chunk_size:
+            yield _parse_rows(header, chunk, usecols, dtype, parser_options)
+            chunk = []
+    if chunk:
+        yield _parse_rows(header, chunk, usecols, dtype, parser_options)
+
+
+def _parse_rows(header, rows, usecols, dtype, parser_options):
+    with TextParser([header] + rows, header=0, usecols=usecols, dtype=dtype, skip_blank_lines=False,
+                    **parser_options) as parser:
+        return parser.read()
+
+
+def _iter_xlsx_rows(file_dir):
+    # pd.read_excel(engine='openpyxl')과 같은 방식으로 셀 값을 바꾼다.
+    import openpyxl
+    from openpyxl.cell.cell import TYPE_ERROR, TYPE_NUMERIC
+
+    if hasattr(file_dir, 'seek'):
+        file_dir.seek(0)
+    workbook = openpyxl.load_workbook(file_dir, read_only=True, data_only=True, keep_links=False)
+    try:
+        worksheet = workbook.worksheets[0]
+        worksheet.reset_dimensions()
+        for row in worksheet.rows:
+            values = []
+            for cell in row:
+                value = cell.value
+                if value is None:
+                    value = ''
+                elif cell.data_type == TYPE_ERROR:
+                    value = np.nan
+                elif cell.data_type == TYPE_NUMERIC and int(value) == value:
+                    value = int(value)
+                values.append(value)
+            yield values
+    finally:
+        workbook.close()
+
+
+def _iter_html_rows(file_dir):
+    # 첫 번째 표의 행만 읽고, 다 읽은 행은 바로 버려서 문서 전체를 메모리에 두지 않는다.
+    from lxml import etree
+
+    encoding = None if b'charset' in _read_head(file_dir, 4096).lower() else 'utf-8'
+    if hasattr(file_dir, 'seek'):
+        file_dir.seek(0)
+    table_depth = 0
+    tables_seen = 0
+    for event, element in etree.iterparse(file_dir, events=('start', 'end'), tag=('table', 'tr'), html=True,
+                                          encoding=encoding):
+        if element.tag == 'table':
+            if event == 'start':
+                table_depth += 1
+                tables_seen += 1
+            else:
+                table_depth -= 1
+                if tables_seen == 1 and table_depth == 0:
+                    return
+            continue
+        if event != 'end' or tables_seen != 1 or table_depth != 1:
+            continue
+
+        values = []
+        for cell in element.iterchildren('td', 'th'):
+            text = _html_whitespace.sub(' ', ''.join(cell.itertext()).strip())
+            values += [text] * int(cell.get('colspan', 1))
+        yield values
+
+        element.clear()
+        while element.getprevious() is not None:
+            del element.getparent()[0]
+
+
+def _iter_parquet_chunks(file_dir, chunk_size, columns, dtype):
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise Exception('Parquet 파일을 읽으려면 pyarrow를 설치해야 합니다.')
+    if hasattr(file_dir, 'seek'):
+        file_dir.seek(0)
+    parquet_file = pq.ParquetFile(file_dir)
+    if columns is not None:
+        columns = [column for column in parquet_file.schema_arrow.names if column in columns]
+    for batch in parquet_file.iter_batches(batch_size=chunk_size, columns=columns):
+        df = batch.to_pandas()
+        if dtype is not None:
+            df = _astype(df, dtype)
+        yield df
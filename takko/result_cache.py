@@ -0,0 +1,78 @@
+import hashlib
+import os
+import uuid
+
+from django.conf import settings
+
+from . import __version__
+
+
+# 같은 파일을 다시 올리면 저장해 둔 결과를 그대로 돌려준다. 파일 수정 시각을 마지막 사용 시각으로 쓴다.
+def _get_cache_dir():
+    return getattr(settings, 'TAKKO_RESULT_CACHE_DIR', os.path.join(settings.BASE_DIR, 'takko_cache'))
+
+
+def _get_cache_size():
+    return getattr(settings, 'TAKKO_RESULT_CACHE_SIZE', 512 * 1024 * 1024)
+
+
+def get_cache_key(uploaded_files, *variant):
+    sha = hashlib.sha256()
+    sha.update(repr((__version__, len(uploaded_files)) + variant).encode())
+    for uploaded_file in uploaded_files:
+        sha.update(b'%d:' % uploaded_file.size)
+        for chunk in uploaded_file.chunks():
+            sha.update(chunk)
+        uploaded_file.seek(0)
+    return sha.hexdigest()
+
+
+def _get_cache_file(key):
+    return os.path.join(_get_cache_dir(), key)
+
+
+def get(key):
+    cache_file = _get_cache_file(key)
+    try:
+        os.utime(cache_file)
+        return open(cache_file, 'rb')
+    except FileNotFoundError:
+        return None
+
+
+def put(key, fh):
+    os.makedirs(_get_cache_dir(), exist_ok=True)
+    cache_file = _get_cache_file(key)
+    tmp_file = '%s.%s.tmp' % (cache_file, uuid.uuid4().hex)
+    fh.seek(0)
+    with open(tmp_file, 'wb') as destination:
+        while True:
+            chunk = fh.read(64 * 1024)
+            if not chunk:
+                break
+            destination.write(chunk)
+    os.replace(tmp_file, cache_file)
+    fh.seek(0)
+    evict()
+
+
+def evict():
+    entries = []
+    for key in os.listdir(_get_cache_dir()):
+        if key.endswith('.tmp'):
+            continue
+        try:
+            stat = os.stat(_get_cache_file(key))
+        except FileNotFoundError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, key))
+
+    total_size = sum(size for _, size, _ in entries)
+    for _, size, key in sorted(entries):
+        if total_size <= _get_cache_size():
+            break
+        try:
+            os.remove(_get_cache_file(key))
+        except FileNotFoundError:
+            pass
+        total_size -= size
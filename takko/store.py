@@ -0,0 +1,316 @@
+import json
+
+import numpy as np
+import pandas as pd
+from django.db import transaction
+
+from .models import StoredRecipient
+from .models import StoredOrder
+from .models import StoredShipment
+from .models import StoredGood
+from . import instrumentation
+from . import matching
+from . import readers
+from .pipeline import TakkoInvoice
+from .pipeline import TakkoOrder
+
+
+# 주문 시트를 DB에 쌓는다. 이미 저장된 상품주문번호는 건너뛰고 새로 들어온 행만 넣는다.
+_sheet_columns = ['상품주문번호', '주문 번호', '수취인 이름', '수취인 핸드폰 번호', '수취인 전체주소',
+                  '수취인 우편번호', '수취인 구 우편번호 (6자리)', '상품명', '옵션정보', '상품수량', '주문시 남기는 글']
+
+# SQLite의 쿼리 변수 개수 제한(999)에 걸리지 않도록 나눠서 조회한다.
+_chunk_size = 500
+
+
+def _chunks(values):
+    values = list(values)
+    for start in range(0, len(values), _chunk_size):
+        yield values[start:start + _chunk_size]
+
+
+def _to_text(value):
+    if pd.isna(value):
+        return None
+    if isinstance(value, (float, np.floating)) and float(value).is_integer():
+        value = int(value)
+    return str(value)
+
+
+def _to_int(value):
+    return None if pd.isna(value) else int(value)
+
+
+def _to_shipment_id(value):
+    text = _to_text(value)
+    return int(text) if text is not None and text.strip().isdigit() else None
+
+
+def _recipient_key(row):
+    return tuple(_to_text(row[column]) or '' for column in ['수취인 이름', '수취인 핸드폰 번호', '수취인 전체주소'])
+
+
+def _find_existing_goods(good_order_ids):
+    existing = set()
+    for chunk in _chunks(good_order_ids):
+        existing.update(StoredGood.objects.filter(good_order_id__in=chunk).values_list('good_order_id', flat=True))
+    return existing
+
+
+def _upsert_recipients(keys):
+    def find(keys):
+        found = {}
+        for chunk in _chunks({phone_number for _, phone_number, _ in keys}):
+            for recipient in StoredRecipient.objects.filter(phone_number__in=chunk):
+                key = (recipient.name, recipient.phone_number, recipient.address)
+                if key in keys:
+                    found[key] = recipient.id
+        return found
+
+    recipient_ids = find(keys)
+    missing = [key for key in keys if key not in recipient_ids]
+    if missing:
+        StoredRecipient.objects.bulk_create(
+            [StoredRecipient(name=name, phone_number=phone_number, address=address)
+             for name, phone_number, address in missing],
+            batch_size=_chunk_size, ignore_conflicts=True)
+        recipient_ids = find(keys)
+    return recipient_ids
+
+
+def _upsert_orders(order_recipients):
+    def find(order_ids):
+        found = {}
+        for chunk in _chunks(order_ids):
+            found.update(StoredOrder.objects.filter(order_id__in=chunk).values_list('order_id', 'id'))
+        return found
+
+    order_ids = find(order_recipients)
+    missing = [order_id for order_id in order_recipients if order_id not in order_ids]
+    if missing:
+        StoredOrder.objects.bulk_create(
+            [StoredOrder(order_id=order_id, recipient_id=order_recipients[order_id]) for order_id in missing],
+            batch_size=_chunk_size, ignore_conflicts=True)
+        order_ids = find(order_recipients)
+    return order_ids
+
+
+def store_orders(orders_df):
+    # 새로 저장한 상품 줄 수를 돌려준다.
+    orders_df = orders_df[orders_df['상품주문번호'].notna()].drop_duplicates('상품주문번호')
+    existing = _find_existing_goods(int(good_order_id) for good_order_id in orders_df['상품주문번호'])
+    new_df = orders_df[~orders_df['상품주문번호'].isin(existing)]
+    if new_df.empty:
+        return 0
+
+    rows = new_df.to_dict('records')
+    with transaction.atomic():
+        recipient_ids = _upsert_recipients({_recipient_key(row) for row in rows})
+        order_recipients = {}
+        for row in rows:
+            order_recipients.setdefault(int(row['주문 번호']), recipient_ids[_recipient_key(row)])
+        order_ids = _upsert_orders(order_recipients)
+
+        StoredGood.objects.bulk_create(
+            [StoredGood(good_order_id=int(row['상품주문번호']),
+                        order_id=order_ids[int(row['주문 번호'])],
+                        name=_to_text(row['상품명']) or '',
+                        option=_to_text(row['옵션정보']),
+                        amount=_to_int(row['상품수량']),
+                        comment=_to_text(row['주문시 남기는 글']),
+                        zip_code=_to_text(row['수취인 우편번호']),
+                        old_zip_code=_to_text(row['수취인 구 우편번호 (6자리)']))
+             for row in rows],
+            batch_size=_chunk_size, ignore_conflicts=True)
+    return len(rows)
+
+
+def _pending_goods():
+    return StoredGood.objects.filter(invoice_number__isnull=True).order_by('id')
+
+
+def pending_orders_df():
+    # 송장번호가 없는 상품만 저장된 순서대로 꺼내서 주문 시트와 같은 모양으로 만든다. 상품마다 상자 번호도 붙인다.
+    goods = _pending_goods().values_list('good_order_id', 'order__order_id', 'order__recipient__name',
+                                         'order__recipient__phone_number', 'order__recipient__address', 'zip_code',
+                                         'old_zip_code', 'name', 'option', 'amount', 'comment', 'shipment_id')
+    df = pd.DataFrame.from_records(list(goods), columns=_sheet_columns + ['상자 번호'])
+    return df.astype({'상품주문번호': 'Int64', '주문 번호': 'Int64', '상품수량': 'Int64', '상자 번호': 'Int64'})
+
+
+def create_shipments():
+    # 송장이 없는 상품을 수취인별로 한 상자로 묶는다. 이미 같은 상품들로 묶인 상자가 있으면 그대로 쓴다.
+    # 수취인은 pending_orders_df로 만든 시트를 TakkoOrder가 묶는 것과 똑같이 matching.recipient_codes로 묶어서,
+    # 합친 시트의 한 행이 상자 하나가 되게 한다. 상자에는 처음 나온 수취인을 쓴다.
+    goods = list(_pending_goods().select_related('order__recipient'))
+    recipient_columns = [np.array(values, dtype=object) for values in zip(*[
+        (good.order.recipient.name, good.order.recipient.phone_number, good.order.recipient.address)
+        for good in goods])] or [np.array([], dtype=object)] * 3
+    goods_by_recipient = {}
+    for recipient_code, good in zip(matching.recipient_codes(*recipient_columns), goods):
+        goods_by_recipient.setdefault(recipient_code, []).append(good)
+
+    shipment_ids = {good.shipment_id for good in goods} - {None}
+    shipment_sizes = {}
+    for chunk in _chunks(shipment_ids):
+        for shipment_id in StoredGood.objects.filter(shipment_id__in=chunk).values_list('shipment_id', flat=True):
+            shipment_sizes[shipment_id] = shipment_sizes.get(shipment_id, 0) + 1
+
+    with transaction.atomic():
+        updated_goods = []
+        for goods in goods_by_recipient.values():
+            if len({good.shipment_id for good in goods}) == 1 and shipment_sizes.get(goods[0].shipment_id) == len(goods):
+                continue
+            recipient = goods[0].order.recipient
+            shipment = StoredShipment.objects.create(recipient=recipient,
+                                                     phone_key=matching.normalize_phone(recipient.phone_number),
+                                                     zip_key=matching.normalize_zip(goods[0].zip_code))
+            for good in goods:
+                good.shipment = shipment
+            updated_goods += goods
+        StoredGood.objects.bulk_update(updated_goods, ['shipment'], batch_size=_chunk_size)
+        # 상품이 모두 다른 상자로 옮겨 간 예전 상자는 지운다. 남겨 두면 택배사 시트의 행이 빈 상자에 붙을 수 있다.
+        StoredShipment.objects.filter(invoice_number__isnull=True, goods__isnull=True).delete()
+
+
+class StoredTakkoOrder(TakkoOrder):
+    # 송장이 없는 주문을 합친 시트. 행마다 상자 번호를 붙여서, 택배사 시트에 이 열을 남겨 오면 송장을 상자 번호로 맞춘다.
+    _out_columns = TakkoOrder._out_columns + ['상자 번호']
+
+    def __init__(self):
+        pending_df = pending_orders_df()
+        self._shipment_ids = dict(zip(pending_df['상품주문번호'], pending_df['상자 번호']))
+        super().__init__(pending_df, streaming=True)
+
+    def _iter_rows(self):
+        order_ids_index = TakkoOrder._out_columns.index('상품주문번호 리스트')
+        for row in super()._iter_rows():
+            shipment_ids = {self._shipment_ids[good_order_id]
+                            for good_order_ids in json.loads(row[order_ids_index]).values()
+                            for good_order_id in good_order_ids}
+            # 상자로 묶기 전이거나 여러 상자에 걸친 행은 번호를 비워 두고 전화번호와 우편번호로 맞춘다.
+            yield row + [shipment_ids.pop() if len(shipment_ids) == 1 else None]
+
+
+class StoredTakkoInvoice(TakkoInvoice):
+    # 상품주문번호 리스트 열 대신 DB에 저장된 상자 기록과 맞춰서 송장 일괄등록 시트를 만든다.
+    # 택배사 시트에 StoredTakkoOrder가 붙인 상자 번호가 남아 있으면 그 번호로 맞추고, 없으면 전화번호와 우편번호로 맞춘다.
+    _shipment_column_candidates = ['상자 번호', '상자번호']
+    _phone_column_candidates = ['수취인 핸드폰 번호', '받는분 전화번호', '받는분전화번호', '받는분 핸드폰',
+                                '수하인 전화번호', '수하인전화번호', '전화번호', '핸드폰 번호']
+    _zip_column_candidates = ['수취인 우편번호', '받는분 우편번호', '받는분우편번호', '수하인 우편번호', '우편번호']
+
+    def __init__(self, file_dir):
+        with instrumentation.stage('read') as record:
+            self._invoice_df = self._read_sheet_file(file_dir)
+            record.rows = len(self._invoice_df)
+        self._invoice_column = self._find_column(self._invoice_column_candidates, '운송장번호')
+        self._shipment_column = self._find_optional_column(self._shipment_column_candidates)
+        if self._shipment_column is None:
+            self._phone_column = self._find_column(self._phone_column_candidates, '전화번호')
+            self._zip_column = self._find_column(self._zip_column_candidates, '우편번호')
+        else:
+            self._phone_column = self._find_optional_column(self._phone_column_candidates)
+            self._zip_column = self._find_optional_column(self._zip_column_candidates)
+        self._unmatched_df = None
+        with instrumentation.stage('match') as record:
+            self._converted_invoice_df = self._convert_invoice_form()
+            record.rows = len(self._converted_invoice_df)
+
+    @classmethod
+    def _read_sheet_file(cls, file_dir):
+        key_columns = cls._shipment_column_candidates + cls._phone_column_candidates + cls._zip_column_candidates
+        return readers.read_sheet_file(file_dir, columns=cls._invoice_column_candidates + key_columns,
+                                       dtype={column: str for column in key_columns})
+
+    def _find_optional_column(self, candidates):
+        for column_name in self._invoice_df.columns:
+            if column_name in candidates:
+                return column_name
+        return None
+
+    def _find_column(self, candidates, description):
+        column_name = self._find_optional_column(candidates)
+        if column_name is None:
+            raise Exception('%s를 찾을 수 없습니다. %s를 나타내는 열이 %r 이 중 '
+                            '최소 하나의 이름과 일치하여야 합니다.' % (description, description, candidates))
+        return column_name
+
+    @property
+    def unmatched_df(self):
+        return self._unmatched_df
+
+    def _get_column(self, column_name):
+        if column_name is None:
+            return [None] * len(self._invoice_df)
+        return self._invoice_df[column_name].tolist()
+
+    def _convert_invoice_form(self):
+        row_invoice_numbers = self._invoice_df[self._invoice_column].tolist()
+        shipment_ids = [_to_shipment_id(shipment_id) for shipment_id in self._get_column(self._shipment_column)]
+        keys = [(matching.normalize_phone(phone_number), matching.normalize_zip(zip_code))
+                for phone_number, zip_code in zip(self._get_column(self._phone_column),
+                                                  self._get_column(self._zip_column))]
+
+        # 상자 번호가 있는 행은 아직 송장이 없는 그 상자에 맞춘다.
+        open_shipments = {}
+        for chunk in _chunks({shipment_id for shipment_id in shipment_ids if shipment_id is not None}):
+            for shipment in StoredShipment.objects.filter(id__in=chunk, invoice_number__isnull=True):
+                open_shipments[shipment.id] = shipment
+        matched_rows = {}
+        for row_idx, (shipment_id, invoice_number) in enumerate(zip(shipment_ids, row_invoice_numbers)):
+            if shipment_id in open_shipments and not pd.isna(invoice_number):
+                matched_rows[row_idx] = open_shipments.pop(shipment_id)
+
+        # 나머지 행은 전화번호와 우편번호로 맞춘다. 같은 키로 송장이 없는 상자나 택배사 행이 여럿이면
+        # 어느 상자의 송장인지 알 수 없으므로 맞추지 않고 unmatched_df로 돌려준다.
+        rows_by_key = {}
+        for row_idx, (shipment_id, key, invoice_number) in enumerate(zip(shipment_ids, keys, row_invoice_numbers)):
+            if row_idx not in matched_rows and shipment_id is None and key[0] and not pd.isna(invoice_number):
+                rows_by_key.setdefault(key, []).append(row_idx)
+        shipments = {}
+        for chunk in _chunks({phone_key for phone_key, _ in rows_by_key}):
+            for shipment in StoredShipment.objects.filter(phone_key__in=chunk, invoice_number__isnull=True):
+                shipments.setdefault((shipment.phone_key, shipment.zip_key), []).append(shipment)
+        matched_shipment_ids = {shipment.id for shipment in matched_rows.values()}
+        for key, row_indices in rows_by_key.items():
+            candidates = [shipment for shipment in shipments.get(key, []) if shipment.id not in matched_shipment_ids]
+            if len(row_indices) == 1 and len(candidates) == 1:
+                matched_rows[row_indices[0]] = candidates[0]
+
+        matched = [(matched_rows[row_idx], row_invoice_numbers[row_idx]) for row_idx in sorted(matched_rows)]
+        self._unmatched_df = self._invoice_df.iloc[[row_idx for row_idx in range(len(self._invoice_df))
+                                                    if row_idx not in matched_rows]]
+
+        with transaction.atomic():
+            for shipment, invoice_number in matched:
+                shipment.invoice_number = _to_text(invoice_number)
+            StoredShipment.objects.bulk_update([shipment for shipment, _ in matched], ['invoice_number'],
+                                               batch_size=_chunk_size)
+
+            goods_by_shipment = {}
+            for chunk in _chunks([shipment.id for shipment, _ in matched]):
+                for good in StoredGood.objects.filter(shipment_id__in=chunk).select_related('order').order_by('id'):
+                    goods_by_shipment.setdefault(good.shipment_id, []).append(good)
+            updated_goods = []
+            for shipment, _ in matched:
+                for good in goods_by_shipment.get(shipment.id, []):
+                    good.invoice_number = shipment.invoice_number
+                    updated_goods.append(good)
+            StoredGood.objects.bulk_update(updated_goods, ['invoice_number'], batch_size=_chunk_size)
+
+        good_order_ids = []
+        order_ids = []
+        invoice_numbers = []
+        for shipment, invoice_number in matched:
+            for good in goods_by_shipment.get(shipment.id, []):
+                good_order_ids.append(good.good_order_id)
+                order_ids.append(str(good.order.order_id))
+                invoice_numbers.append(invoice_number)
+
+        converted_invoice = pd.DataFrame({'번호': np.arange(1, len(good_order_ids) + 1),
+                                          '상품주문번호': good_order_ids,
+                                          '주문번호': order_ids,
+                                          '송장번호': invoice_numbers},
+                                         dtype=object)
+        return converted_invoice.reindex(columns=self._default_columns)
@@ -1,3 +1,730 @@
+import importlib.util
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import warnings
+from concurrent.futures import Future
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from unittest import mock
+from unittest import skipUnless
+
+import numpy as np
+import openpyxl
+import pandas as pd
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import Client
+from django.test import SimpleTestCase
 from django.test import TestCase
+from django.test import override_settings
+
+from . import jobs
+from . import matching
+from . import readers
+from . import result_cache
+from . import store
+from .models import StoredGood
+from .models import StoredShipment
+from .pipeline import TakkoInvoice
+from .pipeline import TakkoOrder
+from .pipeline import Recipient
+from .pipeline import _group_recipient_orders
+from .pipeline import _order_columns
+from .pipeline import _recipient_columns
+
 
 # Create your tests here.
+def make_order_rows(seller):
+    rows = []
+    for i in range(6):
+        rows.append({'상품주문번호': seller * 1000 + i, '주문 번호': seller * 100 + i // 3 * 2 + min(i % 3, 1),
+                     '수취인 이름': '수취인%d-%d' % (seller, i // 3), '수취인 핸드폰 번호': '010-%04d-%04d' % (seller, i // 3),
+                     '수취인 전체주소': '서울특별시 강남구 %d' % seller, '수취인 우편번호': 10000 + seller,
+                     '수취인 구 우편번호 (6자리)': '123-%03d' % seller, '상품명': '상품%d' % (i % 2),
+                     '옵션정보': '색상: 핑크' if i % 3 else None, '상품수량': i + 1, '주문시 남기는 글': None})
+    return pd.DataFrame(rows)
+
+
+def to_excel_bytes(df):
+    buffer = io.BytesIO()
+    df.to_excel(buffer, index=False)
+    return buffer.getvalue()
+
+
+def make_order_sheet(seller):
+    return to_excel_bytes(make_order_rows(seller))
+
+
+def make_invoice_sheet(seller):
+    combined_order_ids = [{str(seller * 100 + i): [seller * 1000 + i]} for i in range(3)]
+    buffer = io.BytesIO()
+    pd.DataFrame({'운송장번호': [seller * 10 + i for i in range(3)],
+                  '상품주문번호 리스트': [json.dumps(ids) for ids in combined_order_ids]}).to_excel(buffer, index=False)
+    return buffer.getvalue()
+
+
+class IsolatedCacheMixin(object):
+    def setUp(self):
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        self.cache_dir = cache_dir.name
+        settings_override = override_settings(TAKKO_RESULT_CACHE_DIR=cache_dir.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+
+class UploadTestCase(IsolatedCacheMixin, SimpleTestCase):
+    pass
+
+
+class ConcurrentUploadTests(UploadTestCase):
+    sellers = range(1, 9)
+
+    def _post(self, url, content):
+        response = Client().post(url, {'file': SimpleUploadedFile('upload.xlsx', content)})
+        self.assertEqual(response.status_code, 200)
+        return pd.read_excel(io.BytesIO(b''.join(response.streaming_content)))
+
+    def test_parallel_order_uploads_get_their_own_result(self):
+        with ThreadPoolExecutor(max_workers=len(self.sellers)) as executor:
+            results = list(executor.map(lambda seller: self._post('/takko/takko', make_order_sheet(seller)),
+                                        self.sellers))
+
+        for seller, combined_orders_df in zip(self.sellers, results):
+            self.assertEqual(list(combined_orders_df['수취인 이름']), ['수취인%d-0' % seller, '수취인%d-1' % seller])
+            good_order_ids = [good_order_id for combined_order_ids in combined_orders_df['상품주문번호 리스트']
+                              for ids in json.loads(combined_order_ids).values() for good_order_id in ids]
+            self.assertEqual(good_order_ids, [seller * 1000 + i for i in range(6)])
+
+    def test_parallel_invoice_uploads_get_their_own_result(self):
+        with ThreadPoolExecutor(max_workers=len(self.sellers)) as executor:
+            results = list(executor.map(lambda seller: self._post('/takko/invoice', make_invoice_sheet(seller)),
+                                        self.sellers))
+
+        for seller, invoice_df in zip(self.sellers, results):
+            self.assertEqual(list(invoice_df['번호']), [1, 2, 3])
+            self.assertEqual(list(invoice_df['상품주문번호']), [seller * 1000 + i for i in range(3)])
+            self.assertEqual(list(invoice_df['송장번호']), [seller * 10 + i for i in range(3)])
+
+
+class ResultCacheTests(UploadTestCase):
+    def _post(self, content):
+        response = Client().post('/takko/takko', {'file': SimpleUploadedFile('upload.xlsx', content)})
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content)
+
+    def test_identical_upload_returns_cached_result(self):
+        content = make_order_sheet(1)
+        result = self._post(content)
+        self.assertEqual(len(os.listdir(self.cache_dir)), 1)
+
+        with mock.patch.object(jobs, 'run_takko') as run_takko:
+            self.assertEqual(self._post(content), result)
+        run_takko.assert_not_called()
+
+    def test_different_upload_is_not_served_from_cache(self):
+        self._post(make_order_sheet(1))
+        self._post(make_order_sheet(2))
+        self.assertEqual(len(os.listdir(self.cache_dir)), 2)
+
+    def test_new_version_is_not_served_from_cache(self):
+        # 결과 형식이 바뀐 버전에서는 예전 버전이 저장한 결과를 돌려주지 않는다.
+        content = make_order_sheet(1)
+        self._post(content)
+        with mock.patch.object(result_cache, '__version__', '0.0.0'):
+            self._post(content)
+        self.assertEqual(len(os.listdir(self.cache_dir)), 2)
+
+    def test_cache_is_bounded(self):
+        with override_settings(TAKKO_RESULT_CACHE_SIZE=1):
+            self._post(make_order_sheet(1))
+            self._post(make_order_sheet(2))
+        self.assertEqual(os.listdir(self.cache_dir), [])
+
+
+class InstrumentationTests(UploadTestCase):
+    def _post(self):
+        return Client().post('/takko/takko', {'file': SimpleUploadedFile('upload.xlsx', make_order_sheet(1))})
+
+    @override_settings(TAKKO_INSTRUMENTATION_MEMORY=True)
+    def test_server_timing_reports_each_stage(self):
+        server_timing = self._post()['Server-Timing']
+        self.assertEqual([metric.split(';')[0] for metric in server_timing.split(', ')],
+                         ['hash', 'read', 'group', 'details', 'write', 'cache'])
+        self.assertIn('read;dur=', server_timing)
+        self.assertIn('rows=6', server_timing)
+        self.assertIn('group;dur=', server_timing)
+        self.assertIn('peak=', server_timing)
+
+    def test_pipeline_log_line(self):
+        with self.assertLogs('takko.instrumentation', 'INFO') as logs:
+            self._post()
+        record = json.loads(logs.records[-1].getMessage())
+        self.assertEqual((record['event'], record['label']), ('takko.pipeline', 'order'))
+        self.assertEqual([stage['stage'] for stage in record['stages']],
+                         ['hash', 'read', 'group', 'details', 'write', 'cache'])
+
+    @override_settings(TAKKO_ORDER_CHUNK_MIN_BYTES=0, TAKKO_ORDER_CHUNK_SIZE=2)
+    def test_chunked_upload_reports_fold_stage(self):
+        server_timing = self._post()['Server-Timing']
+        self.assertEqual([metric.split(';')[0] for metric in server_timing.split(', ')],
+                         ['hash', 'fold', 'write', 'cache'])
+
+    @override_settings(TAKKO_INSTRUMENTATION=False)
+    def test_disabled_instrumentation_adds_no_header(self):
+        self.assertFalse(self._post().has_header('Server-Timing'))
+
+
+class BatchUploadTests(UploadTestCase):
+    def test_batch_merges_recipients_and_drops_duplicate_goods(self):
+        morning = make_order_rows(1)
+        # 오후 파일에는 오전 주문 일부가 다시 들어 있고, 같은 수취인의 새 주문이 추가되어 있다.
+        afternoon = pd.concat([morning.iloc[3:], morning.iloc[[5]].assign(**{'상품주문번호': 1100, '주문 번호': 110})])
+        files = [SimpleUploadedFile('morning.xlsx', to_excel_bytes(morning)),
+                 SimpleUploadedFile('afternoon.xlsx', to_excel_bytes(afternoon)),
+                 SimpleUploadedFile('other.xlsx', make_order_sheet(2))]
+
+        response = Client().post('/takko/batch', {'files': files})
+        self.assertEqual(response.status_code, 200)
+        combined_orders_df = pd.read_excel(io.BytesIO(b''.join(response.streaming_content)))
+
+        self.assertEqual(list(combined_orders_df['수취인 이름']), ['수취인1-0', '수취인1-1', '수취인2-0', '수취인2-1'])
+        self.assertEqual(json.loads(combined_orders_df['상품주문번호 리스트'][1]),
+                         {'102': [1003], '103': [1004, 1005], '110': [1100]})
+
+
+class OutputFormatTests(UploadTestCase):
+    def _post(self, url, file_name, content, output_format=''):
+        response = Client().post(url, {'file': SimpleUploadedFile(file_name, content), 'output_format': output_format})
+        self.assertEqual(response.status_code, 200)
+        return response, io.BytesIO(b''.join(response.streaming_content))
+
+    def test_csv_output_matches_excel_output(self):
+        _, excel_result = self._post('/takko/takko', 'upload.xlsx', make_order_sheet(1))
+        response, csv_result = self._post('/takko/takko', 'upload.xlsx', make_order_sheet(1), 'csv')
+        self.assertIn('combined.csv', response['Content-Disposition'])
+        self.assertTrue(csv_result.getvalue().startswith(b'\xef\xbb\xbf'))
+        pd.testing.assert_frame_equal(pd.read_csv(csv_result, encoding='utf-8-sig'), pd.read_excel(excel_result))
+
+    def test_parquet_input_and_output(self):
+        parquet_sheet = io.BytesIO()
+        pd.read_excel(io.BytesIO(make_invoice_sheet(1))).to_parquet(parquet_sheet, index=False)
+        response, result = self._post('/takko/invoice', 'upload.parquet', parquet_sheet.getvalue(), 'parquet')
+        self.assertIn('invoice.parquet', response['Content-Disposition'])
+        invoice_df = pd.read_parquet(result)
+        self.assertEqual(list(invoice_df['상품주문번호']), [1000, 1001, 1002])
+        self.assertEqual(list(invoice_df['송장번호']), [10, 11, 12])
+
+
+class JobTests(UploadTestCase):
+    def setUp(self):
+        super().setUp()
+        job_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(job_dir.cleanup)
+        settings_override = override_settings(TAKKO_JOB_DIR=job_dir.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        # 테스트에서는 같은 프로세스의 스레드에서 작업을 돌려서 바꾼 설정과 mock이 작업에도 적용되게 한다.
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.addCleanup(self.executor.shutdown)
+        executor_patch = mock.patch.object(jobs, '_get_executor', return_value=self.executor)
+        executor_patch.start()
+        self.addCleanup(executor_patch.stop)
+
+    def _submit(self, url, content):
+        response = Client().post(url, {'file': SimpleUploadedFile('upload.xlsx', content), 'run_async': 'on'})
+        self.assertEqual(response.status_code, 202)
+        self.executor.shutdown(wait=True)
+        return response.json()
+
+    def test_async_upload_reports_status_and_serves_result(self):
+        accepted = self._submit('/takko/invoice', make_invoice_sheet(1))
+        self.assertTrue(os.path.isdir(os.path.join(settings.TAKKO_JOB_DIR, accepted['job_id'])))
+
+        status = Client().get(accepted['status_url']).json()
+        self.assertEqual(status['status'], 'done')
+        self.assertEqual(status['download_url'], accepted['download_url'])
+        response = Client().get(accepted['download_url'])
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('invoice.xlsx', response['Content-Disposition'])
+        invoice_df = pd.read_excel(io.BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual(list(invoice_df['송장번호']), [10, 11, 12])
+
+    def test_failed_job_is_reported(self):
+        with mock.patch.object(jobs, 'run_takko', side_effect=ValueError('bad sheet')):
+            accepted = self._submit('/takko/takko', make_order_sheet(1))
+        status = Client().get(accepted['status_url']).json()
+        self.assertEqual((status['status'], status['error']), ('failed', 'bad sheet'))
+        self.assertEqual(Client().get(accepted['download_url']).status_code, 404)
+
+    def test_failure_outside_run_takko_is_reported(self):
+        with mock.patch.object(jobs.result_cache, 'put', side_effect=OSError('disk full')):
+            accepted = self._submit('/takko/takko', make_order_sheet(1))
+        status = Client().get(accepted['status_url']).json()
+        self.assertEqual((status['status'], status['error']), ('failed', 'disk full'))
+
+    def test_broken_pool_is_reported(self):
+        future = Future()
+        future.set_exception(BrokenProcessPool('worker died'))
+        with mock.patch.object(self.executor, 'submit', return_value=future):
+            accepted = self._submit('/takko/takko', make_order_sheet(1))
+        status = Client().get(accepted['status_url']).json()
+        self.assertEqual((status['status'], status['error']), ('failed', 'worker died'))
+
+    def test_unknown_job_is_not_found(self):
+        self.assertEqual(Client().get('/takko/jobs/00000000-0000-0000-0000-000000000000').status_code, 404)
+        self.assertEqual(Client().get('/takko/jobs/00000000-0000-0000-0000-000000000000/download').status_code, 404)
+
+
+class GroupingTests(SimpleTestCase):
+    def test_recipients_and_orders_keep_first_appearance_order(self):
+        orders_df = pd.DataFrame({'수취인 이름': ['A', 'B', 'A', 'A'], '수취인 핸드폰 번호': ['2', '1', '3', '2'],
+                                  '수취인 전체주소': ['x'] * 4, '수취인 우편번호': ['06035'] * 4,
+                                  '주문 번호': [9, 8, 7, 8]})
+        recipient_orders = _group_recipient_orders(orders_df)
+        self.assertEqual([{order_id: list(indices) for order_id, indices in order_indices.items()}
+                          for order_indices in recipient_orders.values()],
+                         [{9: [0], 8: [3]}, {8: [1]}, {7: [2]}])
+        order_columns = {column: orders_df[column].to_numpy() for column in _recipient_columns}
+        self.assertEqual([(recipient.name, recipient.phone_number)
+                          for recipient in Recipient.from_recipient_orders(order_columns, recipient_orders)],
+                         [('A', '2'), ('B', '1'), ('A', '3')])
+
+
+class RecipientMatchingTests(SimpleTestCase):
+    def test_address_and_phone_variants_are_merged(self):
+        orders_df = make_order_rows(1)
+        # 같은 집을 다르게 적은 두 행과, 같은 건물의 다른 호수 한 행
+        orders_df.loc[3:4, '수취인 이름'] = '수취인1-0'
+        orders_df.loc[3:4, '수취인 핸드폰 번호'] = '01000010000'
+        orders_df.loc[3:4, '수취인 전체주소'] = '서울시  강남구 1 (역삼동)'
+        orders_df.loc[4, '수취인 우편번호'] = '10001'
+        orders_df.loc[5, '수취인 핸드폰 번호'] = '010-0001-0000'
+        orders_df.loc[5, '수취인 전체주소'] = '서울특별시 강남구 2'
+        orders_df = orders_df.astype({'상품주문번호': 'Int64', '주문 번호': 'Int64'})
+
+        combined_orders_df = TakkoOrder(orders_df)._combined_orders_df
+        self.assertEqual(list(combined_orders_df['수취인 전체주소']), ['서울특별시 강남구 1', '서울특별시 강남구 2'])
+        self.assertEqual(json.loads(combined_orders_df['상품주문번호 리스트'][0]),
+                         {'100': [1000], '101': [1001, 1002], '102': [1003], '103': [1004]})
+        self.assertEqual(list(combined_orders_df['합친 수취인']),
+                         ['수취인1-0 / 01000010000 / 서울시  강남구 1 (역삼동)', ''])
+
+        csv_content = io.BytesIO(orders_df.to_csv(index=False).encode('utf-8-sig'))
+        takko_order = TakkoOrder(csv_content, streaming=True, chunk_size=2)
+        self.assertEqual([row[-1] for row in takko_order._iter_combined_orders(takko_order._iter_recipients())],
+                         list(combined_orders_df['합친 수취인']))
+
+    def test_same_recipient_with_different_zip_codes_is_one_parcel(self):
+        # 이름, 전화번호, 주소가 똑같으면 우편번호가 달라도 한 상자다. 읽는 방법과 상관없이 결과가 같아야 한다.
+        orders_df = pd.DataFrame({'수취인 이름': ['A', 'B', 'A', 'C'],
+                                  '수취인 핸드폰 번호': ['010-1', '010-2', '010-1', '010-3'],
+                                  '수취인 전체주소': ['addr1', 'addr2', 'addr1', 'addr3'],
+                                  '수취인 우편번호': ['06035', '06040', '06036', '06050'],
+                                  '수취인 구 우편번호 (6자리)': [None] * 4, '주문 번호': [1, 2, 3, 4],
+                                  '상품주문번호': [10, 20, 30, 40], '상품명': ['상품'] * 4, '옵션정보': [None] * 4,
+                                  '상품수량': [1] * 4, '주문시 남기는 글': [None] * 4})
+        csv_content = orders_df.to_csv(index=False).encode('utf-8-sig')
+
+        def combined_orders(**options):
+            takko_order = TakkoOrder(io.BytesIO(csv_content), streaming=True, **options)
+            return [[str(value) for value in row] for row in takko_order._iter_rows()]
+
+        serial = combined_orders()
+        self.assertEqual([row[0] for row in serial], ['A', 'B', 'C'])
+        self.assertEqual(json.loads(serial[0][5]), {'1': [10], '3': [30]})
+        self.assertEqual(serial[0][4], str(np.array(['06035', '06036'], dtype=object)))
+        self.assertEqual(combined_orders(chunk_size=1), serial)
+        self.assertEqual(combined_orders(workers=2), serial)
+
+    def test_digits_on_both_sides_of_a_space_are_kept_apart(self):
+        self.assertEqual(matching.canonicalize_address('서울특별시 강남구 101동 1001호'),
+                         matching.canonicalize_address('서울시 강남구 101동1001호 (역삼동)'))
+        self.assertNotEqual(matching.canonicalize_address('서울 테헤란로 1, 101동'),
+                            matching.canonicalize_address('서울 테헤란로 11, 01동'))
+
+
+class OrderDetailsTests(SimpleTestCase):
+    def test_columnar_details_match_per_good_details(self):
+        # 한 수취인의 두 주문이 번갈아 나오고, 옵션과 수량이 빠진 상품도 섞여 있다.
+        orders_df = make_order_rows(1)
+        orders_df['주문 번호'] = [101, 102, 101, 102, 101, 102]
+        orders_df['상품명'] = ['상품0', '상품1', '상품2', '상품0', '상품0', '상품1']
+        orders_df.loc[4, '상품수량'] = None
+        takko_order = TakkoOrder(orders_df.astype({'상품주문번호': 'Int64', '주문 번호': 'Int64'}))
+
+        order_columns = {column: orders_df[column].to_numpy() for column in _recipient_columns + _order_columns}
+        expected = [recipient.combined_order_details_to_string
+                    for recipient in Recipient.from_recipient_orders(order_columns, _group_recipient_orders(orders_df))]
+        self.assertEqual(list(takko_order._combined_orders_df['주문 내역']), expected)
+        self.assertEqual(expected, ['상품0: 1.0개 --- 상품2: 색상: 핑크 3.0개 --- 상품1: 색상: 핑크 2.0개',
+                                    '상품0: 4.0개, 색상: 핑크  --- 상품1: 색상: 핑크 6.0개'])
+
+
+class LazyRecipientTests(SimpleTestCase):
+    def test_export_does_not_build_goods(self):
+        orders_df = make_order_rows(1).astype({'상품주문번호': 'Int64', '주문 번호': 'Int64'})
+        with mock.patch('takko.pipeline.Good', side_effect=AssertionError('Good을 만들면 안 됩니다.')):
+            combined_orders_df = TakkoOrder(orders_df)._combined_orders_df
+        self.assertEqual(len(combined_orders_df), 2)
+
+    def test_fields_are_computed_once(self):
+        orders_df = make_order_rows(1)
+        order_columns = {column: orders_df[column].to_numpy() for column in _recipient_columns + _order_columns}
+        recipients = Recipient.from_recipient_orders(order_columns, _group_recipient_orders(orders_df))
+        self.assertEqual([recipient.combined_order_ids for recipient in recipients],
+                         [{100: [1000], 101: [1001, 1002]}, {102: [1003], 103: [1004, 1005]}])
+
+        with mock.patch.object(Recipient, 'read_zip_code', return_value=10001) as read_zip_code:
+            self.assertEqual(recipients[0].zip_code, 10001)
+            self.assertEqual(recipients[0].zip_code, 10001)
+        read_zip_code.assert_called_once_with()
+        self.assertIs(recipients[0].orders, recipients[0].orders)
+
+
+class InvoiceWriterTests(SimpleTestCase):
+    @skipUnless(importlib.util.find_spec('xlwt'), '예전 .xls 결과와 비교하려면 xlwt가 필요합니다.')
+    def test_xlsx_output_matches_legacy_xls_output(self):
+        takko_invoice = TakkoInvoice(io.BytesIO(make_invoice_sheet(1)))
+        legacy = io.BytesIO()
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', FutureWarning)
+            takko_invoice._converted_invoice_df.to_excel(legacy, sheet_name='송장 번호 일괄등록', index=False,
+                                                         engine='xlwt')
+        legacy.seek(0)
+
+        result = takko_invoice.save_to_excel(io.BytesIO())
+        result.seek(0)
+        invoice_df = pd.read_excel(result, sheet_name=None)
+        self.assertEqual(list(invoice_df), ['송장 번호 일괄등록'])
+        pd.testing.assert_frame_equal(invoice_df['송장 번호 일괄등록'], pd.read_excel(legacy, sheet_name='송장 번호 일괄등록'))
+
+    def test_no_xls_row_limit(self):
+        rows = 70000
+        invoice_sheet = pd.DataFrame({'운송장번호': range(rows),
+                                      '상품주문번호 리스트': ['{"1": [%d]}' % i for i in range(rows)]})
+        result = TakkoInvoice(io.BytesIO(invoice_sheet.to_csv(index=False).encode())).save_to_excel(io.BytesIO())
+        result.seek(0)
+        self.assertEqual(openpyxl.load_workbook(result, read_only=True).active.max_row, rows + 1)
+
+
+class SheetReaderTests(SimpleTestCase):
+    sheet_df = pd.DataFrame({'상품주문번호': [1001, 1002], '수취인 우편번호': ['06035', '12345'],
+                             '상품명': ['상품0', '상품1'], '주문시 남기는 글': ['문 앞', None]})
+    columns = ['상품주문번호', '수취인 우편번호', '상품명', '시트에 없는 열']
+    dtype = {'상품주문번호': 'Int64', '수취인 우편번호': str}
+
+    def _assert_read(self, content, sheet_format):
+        self.assertEqual(readers.sniff_format(io.BytesIO(content)), sheet_format)
+        df = readers.read_sheet_file(io.BytesIO(content), columns=self.columns, dtype=self.dtype)
+        self.assertEqual(list(df.columns), ['상품주문번호', '수취인 우편번호', '상품명'])
+        self.assertEqual(str(df['상품주문번호'].dtype), 'Int64')
+        self.assertEqual(list(df['상품주문번호']), [1001, 1002])
+        self.assertEqual(list(df['수취인 우편번호']), ['06035', '12345'])
+        self.assertEqual(list(df['상품명']), ['상품0', '상품1'])
+
+    def test_xlsx(self):
+        self._assert_read(to_excel_bytes(self.sheet_df), 'xlsx')
+
+    @skipUnless(importlib.util.find_spec('xlwt'), 'BIFF .xls 파일을 만들려면 xlwt가 필요합니다.')
+    def test_biff_xls(self):
+        content = io.BytesIO()
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', FutureWarning)
+            self.sheet_df.to_excel(content, index=False, engine='xlwt')
+        self._assert_read(content.getvalue(), 'xls')
+
+    def test_html_disguised_as_xls(self):
+        # 네이버에서 받은 .xls는 실제로는 표 하나가 든 HTML 문서다.
+        content = '<html><head><meta charset="utf-8"></head><body>%s</body></html>' % self.sheet_df.to_html(index=False)
+        self._assert_read(content.encode(), 'html')
+
+    def test_csv(self):
+        self._assert_read(self.sheet_df.to_csv(index=False).encode('utf-8-sig'), 'csv')
+
+
+class ChunkedReadTests(UploadTestCase):
+    def _combined_orders(self, source, **options):
+        takko_order = TakkoOrder(source, streaming=True, **options)
+        return list(takko_order._iter_combined_orders(takko_order._iter_recipients()))
+
+    def test_chunked_read_matches_full_read(self):
+        orders_df = pd.concat([make_order_rows(1), make_order_rows(2)]).sample(frac=1, random_state=0)
+        sheets = {'xlsx': to_excel_bytes(orders_df),
+                  'csv': orders_df.to_csv(index=False).encode('utf-8-sig'),
+                  'html': orders_df.to_html(index=False).encode()}
+        for sheet_format, content in sheets.items():
+            with self.subTest(sheet_format):
+                self.assertEqual(self._combined_orders(io.BytesIO(content), chunk_size=5),
+                                 self._combined_orders(io.BytesIO(content)))
+
+    def test_interleaved_orders_keep_full_read_detail_order(self):
+        # 주문 1의 행 사이에 주문 2의 행이 끼어 있어도 상품명은 주문 순서, 주문 안에서는 행 순서로 나온다.
+        orders_df = pd.DataFrame({'수취인 이름': ['A'] * 5, '수취인 핸드폰 번호': ['010-1'] * 5, '수취인 전체주소': ['addr'] * 5,
+                                  '주문 번호': [1, 2, 1, 1, 2], '상품주문번호': [10, 20, 11, 12, 21],
+                                  '상품명': ['P', 'Y', 'X', 'Y', 'P'], '옵션정보': [None] * 5, '상품수량': [1, 2, 3, 4, 5],
+                                  '주문시 남기는 글': [None] * 5, '수취인 우편번호': ['01234'] * 5,
+                                  '수취인 구 우편번호 (6자리)': [None] * 5})
+        content = orders_df.to_csv(index=False).encode('utf-8-sig')
+        combined_orders = self._combined_orders(io.BytesIO(content), chunk_size=2)
+        self.assertEqual(combined_orders[0][5], json.dumps({'1': [10, 11, 12], '2': [20, 21]}))
+        self.assertEqual(combined_orders[0][6], 'P: 6개 --- X: 3개 --- Y: 6개')
+        self.assertEqual(combined_orders, self._combined_orders(io.BytesIO(content)))
+
+    def test_blank_cell_in_one_chunk_keeps_column_types(self):
+        # 마지막 조각에만 빈 상품수량과 빈 우편번호가 있어도 그 조각의 수량과 우편번호가 float이 되지 않는다.
+        orders_df = pd.concat([make_order_rows(1), make_order_rows(2)], ignore_index=True).astype(object)
+        orders_df.loc[11, '상품수량'] = None
+        orders_df.loc[9:, '수취인 우편번호'] = None
+        parquet_sheet = io.BytesIO()
+        orders_df.to_parquet(parquet_sheet, index=False)
+        sheets = {'xlsx': to_excel_bytes(orders_df), 'csv': orders_df.to_csv(index=False).encode('utf-8-sig'),
+                  'parquet': parquet_sheet.getvalue()}
+        for sheet_format, content in sheets.items():
+            with self.subTest(sheet_format):
+                combined_orders = self._combined_orders(io.BytesIO(content), chunk_size=6)
+                # 빈 우편번호는 형식마다 다른 NaN 객체로 나오므로 글자로 바꿔서 비교한다.
+                self.assertEqual([[str(value) for value in row] for row in combined_orders],
+                                 [[str(value) for value in row] for row in self._combined_orders(io.BytesIO(content))])
+                self.assertEqual(combined_orders[2][4], '10002')
+                self.assertEqual(combined_orders[2][6], '상품0: 1개, 색상: 핑크 3개 --- 상품1: 색상: 핑크 2개')
+
+    @override_settings(TAKKO_ORDER_CHUNK_MIN_BYTES=0, TAKKO_ORDER_CHUNK_SIZE=2)
+    def test_large_upload_is_read_in_chunks(self):
+        with mock.patch.object(readers, 'read_sheet_file', side_effect=AssertionError('시트를 한 번에 읽었습니다.')):
+            response = Client().post('/takko/takko', {'file': SimpleUploadedFile('upload.xlsx', make_order_sheet(1))})
+        self.assertEqual(response.status_code, 200)
+        combined_orders_df = pd.read_excel(io.BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual(list(combined_orders_df['수취인 이름']), ['수취인1-0', '수취인1-1'])
+        self.assertEqual(json.loads(combined_orders_df['상품주문번호 리스트'][1]), {'102': [1003], '103': [1004, 1005]})
+
+
+class ParallelCombineTests(UploadTestCase):
+    def test_parallel_combine_matches_serial_combine(self):
+        orders_df = pd.concat([make_order_rows(seller) for seller in range(1, 6)]).sample(frac=1, random_state=0)
+        orders_df.iloc[0, orders_df.columns.get_loc('수취인 전체주소')] += ' (역삼동)'
+        orders_df = orders_df.reset_index(drop=True).astype({'상품주문번호': 'Int64', '주문 번호': 'Int64'})
+        pd.testing.assert_frame_equal(TakkoOrder(orders_df, workers=3)._combined_orders_df,
+                                      TakkoOrder(orders_df)._combined_orders_df)
+
+    def test_recipient_split_by_zip_code_is_combined_once(self):
+        # 같은 수취인이 우편번호만 다르게 두 번 나오고, 그 사이에 다른 수취인이 끼어 있다.
+        orders_df = make_order_rows(1).iloc[:4].reset_index(drop=True)
+        orders_df['수취인 이름'] = ['A', 'B', 'A', 'C']
+        orders_df['수취인 핸드폰 번호'] = ['010-1', '010-2', '010-1', '010-3']
+        orders_df['수취인 전체주소'] = ['addr1', 'addr2', 'addr1', 'addr3']
+        orders_df['수취인 우편번호'] = ['06035', '06040', '06036', '06050']
+        orders_df = orders_df.astype({'상품주문번호': 'Int64', '주문 번호': 'Int64'})
+        combined_orders_df = TakkoOrder(orders_df, workers=2)._combined_orders_df
+        self.assertEqual(list(combined_orders_df['수취인 이름']), ['A', 'B', 'C'])
+        pd.testing.assert_frame_equal(combined_orders_df, TakkoOrder(orders_df)._combined_orders_df)
+
+    @override_settings(TAKKO_ORDER_WORKERS=2, TAKKO_ORDER_WORKERS_MIN_BYTES=0)
+    def test_upload_is_combined_in_parallel(self):
+        with mock.patch.object(TakkoOrder, '_combine_in_parallel', autospec=True,
+                               side_effect=TakkoOrder._combine_in_parallel) as combine_in_parallel:
+            response = Client().post('/takko/takko', {'file': SimpleUploadedFile('upload.xlsx', make_order_sheet(1))})
+        self.assertEqual(response.status_code, 200)
+        combine_in_parallel.assert_called_once()
+        combined_orders_df = pd.read_excel(io.BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual(list(combined_orders_df['수취인 이름']), ['수취인1-0', '수취인1-1'])
+
+
+class ApiTests(UploadTestCase):
+    def _post(self, url, body, content_type):
+        response = Client().post(url, body, content_type=content_type)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        return [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+
+    def test_ndjson_orders_match_sheet_upload(self):
+        orders_df = make_order_rows(1)
+        body = ''.join(json.dumps(row, ensure_ascii=False) + '\n'
+                       for row in orders_df.astype(object).where(orders_df.notna(), None).to_dict('records'))
+        combined_orders = self._post('/takko/api/orders', body.encode(), 'application/x-ndjson')
+
+        expected_df = TakkoOrder(orders_df.astype({'상품주문번호': 'Int64', '주문 번호': 'Int64'}))._combined_orders_df
+        self.assertEqual([row['수취인 이름'] for row in combined_orders], list(expected_df['수취인 이름']))
+        self.assertEqual([row['주문 내역'] for row in combined_orders], list(expected_df['주문 내역']))
+        self.assertEqual([row['상품주문번호 리스트'] for row in combined_orders],
+                         [json.loads(order_ids) for order_ids in expected_df['상품주문번호 리스트']])
+        self.assertEqual(combined_orders[0]['수취인 우편번호'], '10001')
+
+    def test_combined_orders_convert_to_invoices(self):
+        combined_orders = self._post('/takko/api/orders', json.dumps(
+            make_order_rows(1).astype(object).where(make_order_rows(1).notna(), None).to_dict('records')),
+            'application/json')
+        invoices = [{'운송장번호': 100 + i, '상품주문번호 리스트': row['상품주문번호 리스트']}
+                    for i, row in enumerate(combined_orders)]
+        converted_invoices = self._post('/takko/api/invoices', json.dumps(invoices), 'application/json')
+        self.assertEqual([(row['상품주문번호'], row['송장번호']) for row in converted_invoices],
+                         [(1000, 100), (1001, 100), (1002, 100), (1003, 101), (1004, 101), (1005, 101)])
+        self.assertIsNone(converted_invoices[0]['배송일'])
+
+    def test_missing_columns_are_rejected(self):
+        response = Client().post('/takko/api/orders', json.dumps([{'수취인 이름': 'A'}]),
+                                 content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('주문 번호', response.json()['error'])
+
+    def test_bad_values_are_rejected_before_streaming(self):
+        row = make_order_rows(1).astype(object).where(make_order_rows(1).notna(), None).to_dict('records')[0]
+        for column, value in [('상품수량', 'two'), ('상품주문번호', '1000a'), ('주문 번호', 1.5), ('주문 번호', None),
+                              ('상품주문번호', True), ('상품수량', False), ('수취인 이름', ['A']),
+                              ('옵션정보', {'색상': '핑크'})]:
+            with self.subTest(column=column, value=value):
+                response = Client().post('/takko/api/orders', json.dumps([dict(row, **{column: value})]),
+                                         content_type='application/json')
+                self.assertEqual(response.status_code, 400)
+                self.assertIn(column, response.json()['error'])
+
+    def test_bad_order_id_lists_are_rejected(self):
+        for order_ids in [None, [1000], '[1000]', '{"100": [1000', {'100': 1000}, {'100': [True]}]:
+            with self.subTest(order_ids=order_ids):
+                invoices = [{'운송장번호': 100, '상품주문번호 리스트': {'100': [1000]}},
+                            {'운송장번호': 101, '상품주문번호 리스트': order_ids}]
+                response = Client().post('/takko/api/invoices', json.dumps(invoices), content_type='application/json')
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('2번째 행의 상품주문번호 리스트', response.json()['error'])
+
+    def test_numeric_strings_are_coerced(self):
+        rows = make_order_rows(1).astype(object).where(make_order_rows(1).notna(), None).to_dict('records')
+        expected = self._post('/takko/api/orders', json.dumps(rows), 'application/json')
+        for row in rows:
+            row.update({'상품주문번호': str(row['상품주문번호']), '상품수량': str(row['상품수량'])})
+        rows[0]['주문시 남기는 글'] = 7
+        combined_orders = self._post('/takko/api/orders', json.dumps(rows), 'application/json')
+        self.assertEqual([row['상품주문번호 리스트'] for row in combined_orders],
+                         [row['상품주문번호 리스트'] for row in expected])
+        self.assertEqual([row['주문 내역'] for row in combined_orders], [row['주문 내역'] for row in expected])
+        self.assertEqual(combined_orders[0]['주문시 남기는 글'], '7')
+
+
+class StartupTests(SimpleTestCase):
+    def test_wsgi_application_does_not_import_spreadsheet_stack(self):
+        probe = ("import sys; from takkobebe.wsgi import application; from django.urls import resolve; "
+                 "resolve('/takko/takko'); print(sorted({'numpy', 'pandas', 'takko.pipeline'} & set(sys.modules)))")
+        output = subprocess.check_output([sys.executable, '-c', probe], cwd=settings.BASE_DIR,
+                                         env=dict(os.environ, DJANGO_SETTINGS_MODULE='takkobebe.settings'))
+        self.assertEqual(output.decode().strip(), '[]')
+
+
+class OrderStoreTests(IsolatedCacheMixin, TestCase):
+    def _post(self, df):
+        response = Client().post('/takko/orders', {'file': SimpleUploadedFile('orders.xlsx', to_excel_bytes(df))})
+        self.assertEqual(response.status_code, 200)
+        return int(response['X-Takko-Inserted']), pd.read_excel(io.BytesIO(b''.join(response.streaming_content)))
+
+    def test_second_upload_only_inserts_new_goods(self):
+        morning = make_order_rows(1)
+        afternoon = pd.concat([morning.iloc[3:], make_order_rows(2)])
+
+        inserted, _ = self._post(morning)
+        self.assertEqual(inserted, 6)
+        inserted, combined_orders_df = self._post(afternoon)
+        self.assertEqual(inserted, 6)
+        self.assertEqual(StoredGood.objects.count(), 12)
+
+        expected_df = pd.read_excel(io.BytesIO(b''.join(
+            Client().post('/takko/takko', {'file': SimpleUploadedFile('all.xlsx', to_excel_bytes(
+                pd.concat([morning, make_order_rows(2)])))}).streaming_content)))
+        pd.testing.assert_frame_equal(combined_orders_df.drop(columns='상자 번호'), expected_df)
+        self.assertEqual(set(combined_orders_df['상자 번호']), set(StoredShipment.objects.values_list('id', flat=True)))
+
+    def test_invoiced_goods_are_not_pending(self):
+        self._post(make_order_rows(1))
+        StoredGood.objects.filter(order__recipient__name='수취인1-0').update(invoice_number='600000000001')
+
+        response = Client().get('/takko/orders/pending')
+        combined_orders_df = pd.read_excel(io.BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual(list(combined_orders_df['수취인 이름']), ['수취인1-1'])
+
+    def test_regrouped_goods_leave_no_empty_shipments(self):
+        morning = make_order_rows(1)
+        self._post(morning.iloc[:2])
+        _, combined_orders_df = self._post(morning)
+        # 오전 상자는 새 상품과 함께 다시 묶이고, 상품이 없는 예전 상자는 남지 않는다.
+        self.assertEqual(StoredShipment.objects.count(), 2)
+        self.assertFalse(StoredShipment.objects.filter(goods__isnull=True).exists())
+        self.assertEqual(sorted(combined_orders_df['상자 번호']),
+                         sorted(StoredShipment.objects.values_list('id', flat=True)))
+
+    def test_get_does_not_create_shipments(self):
+        store.store_orders(make_order_rows(1))
+        response = Client().get('/takko/orders/pending')
+        combined_orders_df = pd.read_excel(io.BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual(list(combined_orders_df['수취인 이름']), ['수취인1-0', '수취인1-1'])
+        self.assertTrue(combined_orders_df['상자 번호'].isna().all())
+        self.assertFalse(StoredShipment.objects.exists())
+
+        response = Client().post('/takko/orders/pending')
+        combined_orders_df = pd.read_excel(io.BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual(StoredShipment.objects.count(), 2)
+        self.assertEqual(sorted(combined_orders_df['상자 번호']),
+                         sorted(StoredShipment.objects.values_list('id', flat=True)))
+
+    def test_store_forms_only_ask_for_the_file(self):
+        for url in ['/takko/orders', '/takko/orders/invoice']:
+            content = Client().get(url).content.decode()
+            self.assertIn('name="file"', content)
+            self.assertNotIn('run_async', content)
+            self.assertNotIn('output_format', content)
+
+
+class StoredInvoiceTests(IsolatedCacheMixin, TestCase):
+    def test_courier_sheet_is_matched_by_phone_and_zip(self):
+        Client().post('/takko/orders', {'file': SimpleUploadedFile('orders.xlsx', make_order_sheet(1))})
+        Client().get('/takko/orders/pending')
+        courier_df = pd.DataFrame({'운송장번호': ['600000000002', '600000000001', '600000000009'],
+                                   '받는분 전화번호': ['01000010001', '010-0001-0000', '010-9999-9999'],
+                                   '우편번호': ['10001', '10001', '10001']})
+
+        response = Client().post('/takko/orders/invoice',
+                                 {'file': SimpleUploadedFile('courier.xlsx', to_excel_bytes(courier_df))})
+        self.assertEqual(response['X-Takko-Unmatched'], '1')
+        invoice_df = pd.read_excel(io.BytesIO(b''.join(response.streaming_content)), dtype={'송장번호': str})
+        self.assertEqual(list(invoice_df['상품주문번호']), [1003, 1004, 1005, 1000, 1001, 1002])
+        self.assertEqual(list(invoice_df['주문번호']), [102, 103, 103, 100, 101, 101])
+        self.assertEqual(list(invoice_df['송장번호']), ['600000000002'] * 3 + ['600000000001'] * 3)
+
+        self.assertFalse(StoredGood.objects.filter(invoice_number__isnull=True).exists())
+        response = Client().get('/takko/orders/pending')
+        self.assertTrue(pd.read_excel(io.BytesIO(b''.join(response.streaming_content))).empty)
+
+    def _post_courier_sheet(self, courier_df):
+        response = Client().post('/takko/orders/invoice',
+                                 {'file': SimpleUploadedFile('courier.xlsx', to_excel_bytes(courier_df))})
+        self.assertEqual(response.status_code, 200)
+        return int(response['X-Takko-Unmatched']), pd.read_excel(io.BytesIO(b''.join(response.streaming_content)),
+                                                                 dtype={'송장번호': str})
+
+    def test_courier_sheet_is_matched_by_shipment_id(self):
+        response = Client().post('/takko/orders', {'file': SimpleUploadedFile('orders.xlsx', make_order_sheet(1))})
+        pending_df = pd.read_excel(io.BytesIO(b''.join(response.streaming_content)))
+        # 택배사가 상자 번호 열을 남겨 돌려준다. 전화번호와 우편번호 열이 없어도 된다.
+        courier_df = pd.DataFrame({'운송장번호': ['600000000002', '600000000001', '600000000009'],
+                                   '상자 번호': [pending_df['상자 번호'][1], pending_df['상자 번호'][0], 999999]})
+
+        unmatched, invoice_df = self._post_courier_sheet(courier_df)
+        self.assertEqual(unmatched, 1)
+        self.assertEqual(list(invoice_df['상품주문번호']), [1003, 1004, 1005, 1000, 1001, 1002])
+        self.assertEqual(list(invoice_df['송장번호']), ['600000000002'] * 3 + ['600000000001'] * 3)
+
+    def test_ambiguous_phone_and_zip_are_not_matched(self):
+        # 같은 전화번호와 우편번호로 주소가 다른 두 상자가 있으면 어느 상자의 송장인지 알 수 없다.
+        orders_df = make_order_rows(1)
+        orders_df['수취인 핸드폰 번호'] = '010-0001-0000'
+        orders_df.loc[3:, '수취인 전체주소'] = '서울특별시 강남구 2'
+        Client().post('/takko/orders', {'file': SimpleUploadedFile('orders.xlsx', to_excel_bytes(orders_df))})
+        self.assertEqual(StoredShipment.objects.count(), 2)
+        courier_df = pd.DataFrame({'운송장번호': ['600000000001', '600000000002'],
+                                   '받는분 전화번호': ['01000010000', '01000010000'], '우편번호': ['10001', '10001']})
+
+        unmatched, invoice_df = self._post_courier_sheet(courier_df)
+        self.assertEqual(unmatched, 2)
+        self.assertTrue(invoice_df.empty)
+        self.assertFalse(StoredShipment.objects.filter(invoice_number__isnull=False).exists())
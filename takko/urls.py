@@ -1,9 +1,18 @@
 from django.urls import path
 
+from . import api
 from . import views
 
 urlpatterns = [
     path('', views.index, name='index'),
     path(r'takko', views.upload_file, name='upload_file'),
     path(r'invoice', views.invoice_test, name='invoice_test'),
+    path(r'batch', views.batch_upload, name='batch_upload'),
+    path(r'orders', views.order_store, name='order_store'),
+    path(r'orders/pending', views.pending_orders, name='pending_orders'),
+    path(r'orders/invoice', views.stored_invoice, name='stored_invoice'),
+    path('jobs/<uuid:job_id>', views.job_status, name='job_status'),
+    path('jobs/<uuid:job_id>/download', views.job_download, name='job_download'),
+    path('api/orders', api.combine_orders, name='api_combine_orders'),
+    path('api/invoices', api.convert_invoices, name='api_convert_invoices'),
 ]
\ No newline at end of file
@@ -2,14 +2,22 @@ from django.shortcuts import render
 
 # Create your views here.
 from django.http import HttpResponse
+from django.http import FileResponse
 from django.http import HttpResponseRedirect
+from django.http import Http404
+from django.http import JsonResponse
+from django.urls import reverse
 from django.utils.encoding import smart_str
 
 
+from .models import SheetFileForm
 from .models import UploadFileForm
-from .models import TakkoOrder
-from .models import TakkoInvoice
+from .models import UploadFilesForm
+from . import instrumentation
+from . import jobs
+from . import result_cache
 
+import io
 import os
 
 
@@ -17,52 +25,151 @@ def index(request):
     return HttpResponse("Hello, world. You're at the takko index.")
 
 
-fileDir = 'takkoUploadedFile'
-
-
 def upload_file(request):
     if request.method == 'POST':
         form = UploadFileForm(request.POST, request.FILES)
         if form.is_valid():
-            save_uploaded_file(request.FILES['file'])
             #fileName = combineOrders.combineOrders(fileDir)
-            takko_order = TakkoOrder(fileDir)
-            fileName = takko_order.save_to_excel()
-            return download_file(fileName)
+            return process_upload(request, form, 'order', [request.FILES['file']])
             #return HttpResponseRedirect('/success/url/')
     else:
         form = UploadFileForm()
     return render(request, 'upload.html', {'form': form})
 
 
-def save_uploaded_file(f):
-    with open(fileDir, 'wb+') as destination:
-        for chunk in f.chunks():
-            destination.write(chunk)
+def batch_upload(request):
+    if request.method == 'POST':
+        form = UploadFilesForm(request.POST, request.FILES)
+        if form.is_valid():
+            return process_upload(request, form, 'order', request.FILES.getlist('files'))
+    else:
+        form = UploadFilesForm()
+    return render(request, 'batch_upload.html', {'form': form})
+
+
+def order_store(request):
+    # 올린 주문 중 처음 보는 상품만 DB에 넣고, 송장이 없는 주문 전체를 합친 시트를 돌려준다.
+    # store와 pipeline은 pandas를 불러오므로 워커가 뜰 때가 아니라 처음 요청이 올 때 불러온다.
+    from . import store
+    from .pipeline import read_order_sheet
+
+    if request.method == 'POST':
+        form = SheetFileForm(request.POST, request.FILES)
+        if form.is_valid():
+            inserted = store.store_orders(read_order_sheet(request.FILES['file']))
+            store.create_shipments()
+            response = _pending_orders_response()
+            response['X-Takko-Inserted'] = inserted
+            return response
+    else:
+        form = SheetFileForm()
+    return render(request, 'order_store.html', {'form': form})
+
+
+def pending_orders(request):
+    # GET은 지금 묶인 상자대로 시트만 만든다. 송장이 없는 상품을 상자로 다시 묶는 건 DB를 바꾸므로 POST에서만 한다.
+    from . import store
+
+    if request.method == 'POST':
+        store.create_shipments()
+    return _pending_orders_response()
+
+
+def _pending_orders_response():
+    from . import store
+
+    return download_file(store.StoredTakkoOrder().save_to_excel(io.BytesIO()), 'combined.xlsx')
+
 
+def stored_invoice(request):
+    # 택배사 시트를 DB에 저장된 상자와 전화번호, 우편번호로 맞춰서 송장 일괄등록 시트를 만든다.
+    from . import store
 
-def download_file(fileDir):
-    with open(fileDir, 'rb') as fh:
-        response = HttpResponse(fh.read(), content_type="application/force-download")
-        #response['Content-Disposition'] = 'inline; filename=' + os.path.basename(fileDir)
-        #return response
+    if request.method == 'POST':
+        form = SheetFileForm(request.POST, request.FILES)
+        if form.is_valid():
+            takko_invoice = store.StoredTakkoInvoice(request.FILES['file'])
+            response = download_file(takko_invoice.save_to_excel(io.BytesIO()), 'invoice.xlsx')
+            response['X-Takko-Unmatched'] = len(takko_invoice.unmatched_df)
+            return response
+    else:
+        form = SheetFileForm()
+    return render(request, 'invoice_test.html', {'form': form})
+
+
+def process_upload(request, form, kind, uploaded_files):
+    with instrumentation.collect(kind) as records:
+        response = _process_upload(request, form, kind, uploaded_files)
+    if records:
+        response['Server-Timing'] = instrumentation.server_timing(records)
+    return response
+
+
+def _process_upload(request, form, kind, uploaded_files):
+    output_format = form.cleaned_data['output_format'] or None
+    file_name = jobs.get_result_file_name(kind, output_format)
+
+    # 같은 파일을 다시 올린 경우 저장해 둔 결과를 바로 돌려준다.
+    with instrumentation.stage('hash'):
+        variant = (kind, output_format) if output_format else (kind,)
+        cache_key = result_cache.get_cache_key(uploaded_files, *variant)
+    if form.cleaned_data['run_async']:
+        return job_accepted(request, jobs.submit_job(kind, uploaded_files, cache_key, output_format))
+
+    cached_file = result_cache.get(cache_key)
+    if cached_file is not None:
+        return download_file(cached_file, file_name)
 
-        response['Content-Disposition'] = 'attachment; filename=%s' % smart_str(fileDir)
-        response['X-Sendfile'] = smart_str(fileDir)
-        # It's usually a good idea to set the 'Content-Length' header too.
-        # You can also set any other required headers: Cache-Control, etc.
-        return response
+    result = jobs.run_takko(kind, uploaded_files, io.BytesIO(), output_format)
+    with instrumentation.stage('cache'):
+        result_cache.put(cache_key, result)
+    return download_file(result, file_name)
+
+
+def download_file(fh, file_name):
+    # 파일 전체를 다시 읽어 복사하지 않고 FileResponse로 조각조각 흘려보낸다.
+    fh.seek(0)
+    response = FileResponse(fh, content_type="application/force-download")
+    #response['Content-Disposition'] = 'inline; filename=' + os.path.basename(fileDir)
+    #return response
+
+    response['Content-Disposition'] = 'attachment; filename=%s' % smart_str(file_name)
+    if hasattr(fh, 'getbuffer'):
+        response['Content-Length'] = fh.getbuffer().nbytes
+    # You can also set any other required headers: Cache-Control, etc.
+    return response
 
 
 def invoice_test(request):
     if request.method == 'POST':
         form = UploadFileForm(request.POST, request.FILES)
         if form.is_valid():
-            save_uploaded_file(request.FILES['file'])
             #fileName = matchInvoiceNumbers.matchInvoiceNumbers(fileDir)
-            takko_invoice = TakkoInvoice(fileDir)
-            fileName = takko_invoice.save_to_excel()
-            return download_file(fileName)
+            return process_upload(request, form, 'invoice', [request.FILES['file']])
     else:
         form = UploadFileForm()
     return render(request, 'invoice_test.html', {'form': form})
+
+
+def job_accepted(request, job_id):
+    return JsonResponse({'job_id': str(job_id),
+                         'status_url': request.build_absolute_uri(reverse('job_status', args=[job_id])),
+                         'download_url': request.build_absolute_uri(reverse('job_download', args=[job_id]))},
+                        status=202)
+
+
+def job_status(request, job_id):
+    status = jobs.get_job_status(job_id)
+    if status is None:
+        raise Http404('작업을 찾을 수 없습니다.')
+    status['job_id'] = str(job_id)
+    if status['status'] == 'done':
+        status['download_url'] = request.build_absolute_uri(reverse('job_download', args=[job_id]))
+    return JsonResponse(status)
+
+
+def job_download(request, job_id):
+    result_file = jobs.get_job_result(job_id)
+    if result_file is None:
+        raise Http404('작업이 없거나 아직 끝나지 않았습니다.')
+    return download_file(open(result_file, 'rb'), os.path.basename(result_file))
@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/2.0/ref/settings/
 """
 
 import os
+import sys
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -122,3 +123,63 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/2.0/howto/static-files/
 
 STATIC_URL = '/static/'
+
+
+# Takko background jobs
+
+TAKKO_JOB_DIR = os.path.join(BASE_DIR, 'takko_jobs')
+
+TAKKO_JOB_WORKERS = 2
+
+TAKKO_JOB_TTL = 24 * 60 * 60
+
+
+# Takko result cache
+
+TAKKO_RESULT_CACHE_DIR = os.path.join(BASE_DIR, 'takko_cache')
+
+TAKKO_RESULT_CACHE_SIZE = 512 * 1024 * 1024
+
+
+# Takko chunked order reading (uploads at least this large are read CHUNK_SIZE rows at a time)
+
+TAKKO_ORDER_CHUNK_MIN_BYTES = 16 * 1024 * 1024
+
+TAKKO_ORDER_CHUNK_SIZE = 10000
+
+
+# Takko parallel order combining (uploads at least WORKERS_MIN_BYTES are combined by WORKERS processes instead of
+# being read in chunks; None keeps it serial)
+
+TAKKO_ORDER_WORKERS = None
+
+TAKKO_ORDER_WORKERS_MIN_BYTES = 4 * 1024 * 1024
+
+
+# Takko pipeline preloading (load pandas and the spreadsheet stack in wsgi.py, e.g. in a pre-fork master)
+
+TAKKO_PRELOAD = False
+
+
+# Takko pipeline instrumentation
+
+TAKKO_INSTRUMENTATION = True
+
+TAKKO_INSTRUMENTATION_MEMORY = False
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'takko': {
+            'handlers': ['console'],
+            # 테스트에서는 요청마다 나오는 takko.pipeline 로그를 콘솔에 찍지 않는다.
+            'level': 'WARNING' if sys.argv[1:2] == ['test'] else 'INFO',
+        },
+    },
+}
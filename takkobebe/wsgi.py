@@ -14,3 +14,11 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "takkobebe.settings")
 
 application = get_wsgi_application()
+
+# 기본으로는 pandas와 엑셀 처리 모듈을 첫 요청 때 불러온다. gunicorn --preload처럼 워커를 포크하기 전에
+# 이 모듈을 불러오는 서버라면 TAKKO_PRELOAD를 켜서 마스터에서 한 번만 불러오고 워커들이 나눠 쓰게 한다.
+from django.conf import settings
+
+if getattr(settings, 'TAKKO_PRELOAD', False):
+    import takko.pipeline
+    import takko.store